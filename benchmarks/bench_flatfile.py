@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the PennMUSH flatfile tokenizers against each other on a synthetic outdb.
+
+Usage:
+    python benchmarks/bench_flatfile.py [--objects 100000] [--path /tmp/synthetic.outdb] [--keep]
+
+Every generated object is around thirty lines, so the default makes a dump of a few
+million lines - roughly what a mature game produces.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from vmush.db.flatfile import parse_flatfile, FlatfileReader
+
+
+FLAGS = ("WIZARD", "ROYALTY", "NO_COMMAND", "VISUAL", "SAFE", "FLOATING", "DARK")
+POWERS = ("Builder", "Hide", "Idle", "See_All")
+ATTR_FLAGS = ("no_command", "visual", "wizard", "locked", "no_inherit")
+WORDS = ("the", "quick", "brown", "fox", "jumps", "over", "lazy", "dog", "mush", "code")
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _value(rng, length):
+    out = " ".join(rng.choice(WORDS) for _ in range(length))
+    # Sprinkle in the things that make tokenizing hard: embedded quotes, escapes,
+    # literal newlines and ANSI markup.
+    roll = rng.random()
+    if roll < 0.1:
+        out += ' "quoted" \\ backslash'
+    elif roll < 0.2:
+        out += "\nsecond line\n!123\nthird line"
+    elif roll < 0.3:
+        out = f"\x02chr\x0e{out}\x02c/\x03"
+    return out
+
+
+def write_synthetic_outdb(path, objects, seed=0):
+    """
+    Writes a PennMUSH-style outdb with the given number of objects to path.
+    """
+    rng = random.Random(seed)
+    with open(path, "w", encoding="latin_1", newline="") as f:
+        w = f.write
+        w("+V-1342182340\n")
+        w("dbversion 5\n")
+        w('savedtime "Sun Jun 06 12:00:00 2021"\n')
+
+        for section, names in (("+FLAGS LIST", FLAGS), ("+POWER LIST", POWERS)):
+            w(f"{section}\n")
+            w(f"flagcount {len(names)}\n")
+            for name in names:
+                w(f' name "{name}"\n')
+                w(f'  letter "{name[0]}"\n')
+                w('  type "PLAYER THING ROOM EXIT"\n')
+                w('  perms "trusted"\n')
+                w('  negate_perms "trusted"\n')
+            w("flagaliascount 1\n")
+            w(f' name "{names[0]}"\n')
+            w(f'  alias "{names[0][:3]}"\n')
+
+        w("+ATTRIBUTES LIST\n")
+        w("attrcount 2\n")
+        for name in ("DESCRIBE", "COBJ"):
+            w(f' name "{name}"\n')
+            w('  flags "no_command"\n')
+            w("  creator #1\n")
+            w('  data ""\n')
+        w("attraliascount 0\n")
+
+        w(f"~{objects}\n")
+        for dbref in range(objects):
+            w(f"!{dbref}\n")
+            w(f'name "Object {dbref}"\n')
+            w(f"location #{rng.randrange(objects)}\n")
+            w("contents #-1\n")
+            w("exits #-1\n")
+            w("next #-1\n")
+            w(f"parent #{rng.randrange(-1, objects)}\n")
+            w("lockcount 1\n")
+            w(' type "Basic"\n')
+            w("  creator #1\n")
+            w('  flags "no_inherit"\n')
+            w("  derefs 0\n")
+            w('  key "#TRUE"\n')
+            w(f"owner #{rng.randrange(objects)}\n")
+            w("zone #-1\n")
+            w(f"pennies {rng.randrange(1000)}\n")
+            w(f"type {rng.choice((1, 2, 4, 8))}\n")
+            w(f'flags "{" ".join(rng.sample(FLAGS, 2))}"\n')
+            w(f'powers "{rng.choice(POWERS)}"\n')
+            w('warnings ""\n')
+            w(f"created {1600000000 + dbref}\n")
+            w(f"modified {1600000000 + dbref}\n")
+            attrs = rng.randrange(1, 6)
+            w(f"attrcount {attrs}\n")
+            for a in range(attrs):
+                w(f' name "ATTR`{a}"\n')
+                w("  owner #1\n")
+                w(f'  flags "{rng.choice(ATTR_FLAGS)}"\n')
+                w("  derefs 0\n")
+                w(f'  value "{_escape(_value(rng, rng.randrange(1, 40)))}"\n')
+        w("***END OF DUMP***\n")
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed:8.2f}s")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the outdb tokenizers.")
+    parser.add_argument("--objects", type=int, default=100000)
+    parser.add_argument("--path", default=None)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    path = args.path or os.path.join(tempfile.gettempdir(), "vmush-synthetic.outdb")
+    if not os.path.exists(path):
+        _, elapsed = timed("generate", lambda: write_synthetic_outdb(path, args.objects))
+    size = os.path.getsize(path)
+    print(f"dump: {path} ({size / 1024 / 1024:.1f} MB)")
+
+    try:
+        old, old_time = timed("parse_flatfile", lambda: list(parse_flatfile(path)))
+        new, new_time = timed("FlatfileReader", lambda: list(FlatfileReader(path)))
+        print(f"lines: {len(new)}")
+        if old != new:
+            print("MISMATCH: the tokenizers disagree!")
+            return 1
+        print(f"speedup: {old_time / new_time:.1f}x")
+    finally:
+        if not (args.keep or args.path):
+            os.unlink(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
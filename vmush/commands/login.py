@@ -17,16 +17,18 @@ class ImportCommand(Command):
     name = "@import"
     re_match = re.compile(r"^(?P<cmd>@import)(?: +(?P<args>.+)?)?", flags=re.IGNORECASE)
     help_category = "System"
+    path = "outdb"
 
     @classmethod
     async def access(cls, entry):
+        # Only an empty game can be imported into from here. Finishing or updating an
+        # import is @import on the account screen, for admins.
         if entry.game.objects:
             return False
         return True
 
     async def execute(self):
-        penn = Importer(self.entry, "outdb")
-        self.entry.msg(f"Database loaded: {len(penn.db.objects)} objects detected!")
+        penn = Importer(self.entry, self.path)
         await penn.run()
 
 
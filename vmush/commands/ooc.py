@@ -0,0 +1,59 @@
+import re
+from vmush.db.importer import Importer, IncrementalImporter
+from pymush.commands.base import (
+    Command,
+    CommandException,
+)
+from pymush.commands.ooc import SelectCommandMatcher as OldCmdMatcher
+
+
+class AdminImportCommand(Command):
+    """
+    Picks up an @import that was cut short, from its last checkpoint. Otherwise, if an
+    earlier import finished, brings the game up to date with a newer outdb, writing
+    only what changed since.
+
+    Only admins may use it, since by then the game already has objects. The import
+    itself holds a lock for as long as it runs, so a second @import started meanwhile
+    just reports that one is running.
+
+    Usage:
+        @import
+    """
+
+    name = "@import"
+    re_match = re.compile(r"^(?P<cmd>@import)(?: +(?P<args>.+)?)?", flags=re.IGNORECASE)
+    help_category = "System"
+    path = "outdb"
+    # The admin level @import gives the accounts of imported wizards.
+    admin_level = 10
+
+    @classmethod
+    async def access(cls, entry):
+        return entry.user.admin_level >= cls.admin_level
+
+    async def execute(self):
+        resume = Importer.can_resume(self.path)
+        if IncrementalImporter.can_update(self.path):
+            if (missing := IncrementalImporter.missing_calls(self.entry.game)):
+                raise CommandException(
+                    "This game can't apply an update to an import. Its database has no "
+                    + ", ".join(f"{name}()" for name in missing)
+                    + "."
+                )
+            penn = IncrementalImporter(self.entry, self.path)
+        elif resume:
+            penn = Importer(self.entry, self.path)
+        else:
+            raise CommandException(
+                "There is no unfinished import to resume, nor a finished one to update."
+            )
+        if resume:
+            self.entry.msg("Resuming the previous import from its last checkpoint.")
+        await penn.run()
+
+
+class SelectCommandMatcher(OldCmdMatcher):
+    def at_cmdmatcher_creation(self):
+        super().at_cmdmatcher_creation()
+        self.add(AdminImportCommand)
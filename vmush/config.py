@@ -18,3 +18,4 @@ class Config(BaseConfig):
         super()._config_matchers()
         m = self.command_matchers
         m["login"]["login"] = "vmush.commands.login.LoginCommandMatcher"
+        m["ooc"]["ooc"] = "vmush.commands.ooc.SelectCommandMatcher"
@@ -1,6 +1,13 @@
+from __future__ import annotations
+
 import re
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Dict, List
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Tuple
+
+from django.db import transaction
+from django.db.models import Q
 
 RE_ACL = re.compile(
     r"(?s)^(?P<addremove>\+|-)(?P<deny>!)?(?P<prefix>\w+):(?P<name>.*?)(?::(?P<mode>.*?))?(?P<perms>(\/\w+){1,})$"
@@ -17,12 +24,119 @@ class ACLEntry:
     mode: str = ""
 
 
+class PermissionSchema:
+    """
+    An ACLHandler subclass's permissions, compiled once when the class is created.
+
+    bits maps each permission name to its bit. grants maps each name to every bit that
+    grants it: its own, full's, and those of the permissions that imply it, followed
+    transitively through permissions_implicit. Both are read-only.
+    """
+
+    __slots__ = ("bits", "grants")
+
+    def __init__(self, base: dict, custom: dict, implicit: dict):
+        bits = dict(base)
+        bits.update(custom)
+        full = bits.get("full", 0)
+        grants = dict()
+        for perm, bit in bits.items():
+            mask = bit | full
+            seen = {perm}
+            pending = list(implicit.get(perm, []))
+            while pending:
+                if (other := pending.pop()) in seen:
+                    continue
+                seen.add(other)
+                mask |= bits.get(other, 0)
+                pending.extend(implicit.get(other, []))
+            grants[perm] = mask
+        self.bits = MappingProxyType(bits)
+        self.grants = MappingProxyType(grants)
+
+    def mask(self, perms) -> int:
+        """
+        Returns the bits of perms - a list of names, or one string of them separated by
+        slashes - raising ValueError for a name that isn't a permission.
+        """
+        if isinstance(perms, str):
+            perms = [p.strip().lower() for p in perms.split("/") if p]
+        mask = 0
+        bits = self.bits
+        for perm in perms:
+            if (bit := bits.get(perm, None)) is None:
+                raise ValueError(f"Permission not found: {perm}")
+            mask |= bit
+        return mask
+
+
+class CompiledACL:
+    """
+    An object's ACL rows, read once and folded into one allow and one deny mask per
+    (identity, mode).
+
+    Whether an accessor is represented by each identity is still asked on every check,
+    since that depends on things like group membership rather than on the ACL.
+    """
+
+    def __init__(self, rows):
+        masks = dict()
+        for row in rows:
+            allow, deny = masks.get((row.identity, row.mode), (0, 0))
+            masks[(row.identity, row.mode)] = (
+                allow | int(row.allow_permissions),
+                deny | int(row.deny_permissions),
+            )
+        self.entries = [(i, m, a, d) for (i, m), (a, d) in masks.items()]
+
+    def masks(self, accessor, represents: dict = None) -> Tuple[int, int]:
+        """
+        Returns (allow, deny) - the permissions of every entry that accessor represents.
+
+        represents, if given, memoizes identity.represents(accessor, mode) by
+        (identity, mode), so it can be shared between objects checked together.
+        """
+        allow = deny = 0
+        for identity, mode, entry_allow, entry_deny in self.entries:
+            if represents is None:
+                matched = identity.represents(accessor, mode)
+            elif (matched := represents.get((identity, mode), None)) is None:
+                matched = represents[(identity, mode)] = identity.represents(accessor, mode)
+            if matched:
+                allow |= entry_allow
+                deny |= entry_deny
+        return allow, deny
+
+
 class ACLHandler:
     permissions_base = {"full": 1}
     permissions_custom = {}
     permissions_init = "+S:OWNER/full"
     permissions_implicit = {}
 
+    # (model label, object pk) -> CompiledACL, for the most recently checked
+    # compiled_cache_size objects. apply_acl() drops the object's entry, and that is the
+    # only thing that does: ACL rows changed any other way - deleted along with their
+    # identity, edited in the admin, or written by another process - go on granting
+    # what they used to until the entry is evicted or invalidate() is called. Code
+    # that changes rows directly must call invalidate(), and a game that runs more than
+    # one process should set compiled_cache_size to 0.
+    compiled = OrderedDict()
+    compiled_cache_size = 4096
+    # Compiled from the permissions_ attributes by compile_schema(), which runs for
+    # every subclass as it's created.
+    schema: PermissionSchema = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.compile_schema()
+
+    @classmethod
+    def compile_schema(cls):
+        cls.schema = PermissionSchema(
+            cls.permissions_base, cls.permissions_custom, cls.permissions_implicit
+        )
+
     def __init__(self, obj):
         self.obj = obj
 
@@ -47,11 +161,8 @@ class ACLHandler:
             return False
         return True
 
-    def perm_dict(self) -> Dict[str, int]:
-        d = dict()
-        d.update(self.permissions_base)
-        d.update(self.permissions_custom)
-        return d
+    def perm_dict(self) -> Mapping[str, int]:
+        return self.schema.bits
 
     def is_owner(self, obj_to_check) -> bool:
         return False
@@ -59,99 +170,277 @@ class ACLHandler:
     def check_access(self, accessor, perm: str) -> bool:
         return self.check_acl(accessor, perm)
 
-    def check_acl(self, accessor, perm: str) -> bool:
+    def perm_bit(self, perm: str) -> int:
+        """
+        Returns the bits that grant perm: its own, full's, and those of the permissions
+        that imply it.
+        """
+        return self.schema.grants[perm]
+
+    @staticmethod
+    def cache_key(obj) -> Tuple[str, int]:
+        # pks are only unique within a model, and every model's handlers share the cache.
+        return obj._meta.label, obj.pk
+
+    def invalidate(self):
+        self.compiled.pop(self.cache_key(self.obj), None)
+
+    @classmethod
+    def cache_compiled(cls, key, compiled: CompiledACL):
+        cls.compiled[key] = compiled
+        cls.compiled.move_to_end(key)
+        while len(cls.compiled) > cls.compiled_cache_size:
+            cls.compiled.popitem(last=False)
+
+    def compiled_acl(self) -> CompiledACL:
+        """
+        Returns this object's CompiledACL, compiling it from the database if it hasn't
+        been since the ACL last changed.
+        """
+        key = self.cache_key(self.obj)
+        if (found := self.compiled.get(key, None)) is not None:
+            self.compiled.move_to_end(key)
+            return found
         self.integrity_check()
-        pdict = self.perm_dict()
-        entries = list()
+        found = CompiledACL(self.obj.acl_entries.all().select_related("identity"))
+        self.cache_compiled(key, found)
+        return found
 
-        # On the off-chance 're fed a non-identity, try and coerce it into one.
+    @classmethod
+    def check_access_many(cls, accessor, perm: str, objects) -> List[bool]:
+        """
+        check_access() for many objects at once, returning one bool per object.
+
+        Objects whose compiled ACL isn't cached have their rows fetched together in one
+        query, and whether accessor represents each (identity, mode) is worked out once
+        for all of them.
+
+        As in compiled_acl(), every uncached object has its initialization checked
+        first, all of them in one initialized_many() pass, so the rows read afterwards
+        include any permissions_init just added. Initializing writes to each such object,
+        so a list of never-checked objects still costs a write per object the first time.
+        """
+        handlers = [cls(obj) for obj in objects]
         try:
             accessor = accessor.get_identity()
         except Exception:
-            return False
+            return [False] * len(handlers)
         if not accessor:
-            return False
+            return [False] * len(handlers)
+        if not handlers:
+            return list()
 
-        bit = pdict[perm] + 1
-        for p in self.permissions_implicit.get(perm, []):
-            bit += pdict.get(p, 0)
+        compiled = dict()
+        stale = list()
+        for handler in handlers:
+            key = cls.cache_key(handler.obj)
+            if (found := cls.compiled.get(key, None)) is not None:
+                cls.compiled.move_to_end(key)
+                compiled[key] = found
+            else:
+                stale.append(handler)
+        if stale:
+            for handler, initialized in zip(stale, cls.initialized_many(stale)):
+                if not initialized:
+                    handler.initialize()
+            rows = cls.fetch_rows(stale)
+            for handler in stale:
+                key = cls.cache_key(handler.obj)
+                compiled[key] = CompiledACL(rows[handler.obj.pk])
+                cls.cache_compiled(key, compiled[key])
 
-        for entry in self.obj.acl_entries.all():
-            if entry.identity.represents(accessor, entry.mode):
-                # First, check for Denies.
-                if entry.deny_permissions | bit:
-                    return False
-                entries.append(entry)
+        bit = handlers[0].perm_bit(perm)
+        represents = dict()
+        out = list()
+        for handler in handlers:
+            allow, deny = compiled[cls.cache_key(handler.obj)].masks(accessor, represents)
+            out.append(not deny & bit and bool(allow & bit))
+        return out
 
-        for entry in entries:
-            # Then check for Allows.
-            if entry.allow_permissions | bit:
-                return True
+    @staticmethod
+    def initialized_many(handlers) -> List[bool]:
+        """
+        is_initialized() for every handler, in one pass. A subclass whose objects keep
+        the flag somewhere that can be read for many objects at once should override
+        this to do so.
+        """
+        return [handler.is_initialized() for handler in handlers]
 
-        return False
+    @staticmethod
+    def fetch_rows(handlers) -> Dict[int, list]:
+        """
+        Reads the ACL rows of every handler's object in one query.
 
-    def parse_acl(self, entry, enactor=None) -> List[ACLEntry]:
-        entries = list()
+        Returns:
+            {object pk: [rows]}, with an empty list for objects that have none.
+        """
+        manager = handlers[0].obj.acl_entries
+        field = manager.field.name
+        rows = {h.obj.pk: list() for h in handlers}
+        for row in manager.model.objects.filter(
+            **{f"{field}__in": [h.obj for h in handlers]}
+        ).select_related("identity"):
+            rows[getattr(row, f"{field}_id")].append(row)
+        return rows
 
+    def check_acl(self, accessor, perm: str) -> bool:
+        # On the off-chance 're fed a non-identity, try and coerce it into one.
+        try:
+            accessor = accessor.get_identity()
+        except Exception:
+            return False
+        if not accessor:
+            return False
+
+        bit = self.perm_bit(perm)
+        allow, deny = self.compiled_acl().masks(accessor)
+        # Denies win over allows.
+        if deny & bit:
+            return False
+        return bool(allow & bit)
+
+    def parse_acl(self, entry, enactor=None) -> List[ACLEntry]:
+        matches = list()
         for s in entry.split(","):
             if not (match := RE_ACL.match(s)):
                 print(match)
                 raise ValueError(f"invalid ACL entry: {s}")
-            gd = match.groupdict()
+            matches.append((s, match.groupdict()))
+
+        identities = self.find_identities(
+            [(gd.get("prefix"), gd.get("name")) for s, gd in matches], enactor
+        )
+        entries = list()
+
+        for s, gd in matches:
             deny = bool(gd.get("deny", False))
             remove = True if gd.get("addremove") == "-" else False
-            if enactor:
-                identity = enactor.find_identity(
-                    prefix=gd.get("prefix"), name=gd.get("name")
-                )
-            else:
-                identity = IdentityDB.objects.filter(
-                    db_namespace__db_prefix__iexact=gd.get("prefix"),
-                    db_key__iexact=gd.get("name"),
-                ).first()
-            if not identity:
+            key = (gd.get("prefix").lower(), gd.get("name").lower())
+            if not (identity := identities.get(key, None)):
                 raise ValueError(f"Identity Not found: {s}")
             mode = gd.get("mode", "")
             perms = [p.strip().lower() for p in gd.get("perms").split("/") if p]
-            p_dict = self.perm_dict()
-            for perm in perms:
-                if perm not in p_dict:
-                    raise ValueError(f"Permission not found: {perm}")
+            self.schema.mask(perms)
 
             acl_e = ACLEntry(remove, deny, identity, perms, mode)
             entries.append(acl_e)
 
         return entries
 
-    def apply_acl(self, entries: List[ACLEntry], report_to=None):
-        p_dict = self.perm_dict()
-        for entry in entries:
-            mode = entry.mode if entry.mode else ""
-            if not (
-                row := self.obj.acl_entries.filter(
-                    identity=entry.identity, mode=mode
-                ).first()
-            ):
-                row = self.obj.acl_entries.create(identity=entry.identity, mode=mode)
-            bitfield = int(
-                row.allow_permissions if not entry.deny else row.deny_permissions
+    @staticmethod
+    def find_identities(names, enactor=None) -> dict:
+        """
+        Looks up every (prefix, name) in names, ignoring case. Without an enactor to ask,
+        they're all fetched in one query.
+
+        Returns:
+            {(prefix, name) lowercased: identity} for those that were found.
+        """
+        wanted = {(prefix.lower(), name.lower()) for prefix, name in names}
+        out = dict()
+        if enactor:
+            for prefix, name in wanted:
+                if (identity := enactor.find_identity(prefix=prefix, name=name)) :
+                    out[(prefix, name)] = identity
+            return out
+        query = Q()
+        for prefix, name in wanted:
+            query |= Q(db_namespace__db_prefix__iexact=prefix, db_key__iexact=name)
+        for identity in IdentityDB.objects.filter(query).select_related("db_namespace"):
+            key = (identity.db_namespace.db_prefix.lower(), identity.db_key.lower())
+            out.setdefault(key, identity)
+        return out
+
+    def apply_acl(self, entries: List[ACLEntry], report_to=None) -> Dict[str, int]:
+        """
+        Applies parsed ACL entries, in order, to this object's ACL.
+
+        Everything happens in one transaction. The object and the rows involved are
+        locked with select_for_update() and read in one query, and the new bitfields
+        worked out in memory. Then come a bulk insert of new rows, a bulk update of
+        changed ones and one delete of the rows left with no permissions. Two applies
+        to the same object therefore take turns, and neither overwrites the other.
+
+        Returns:
+            {"created": n, "updated": n, "deleted": n}, which is also sent to report_to.
+        """
+        schema = self.schema
+        manager = self.obj.acl_entries
+        identities = {entry.identity for entry in entries}
+        with transaction.atomic():
+            # Locking the object as well as its rows makes an apply that would insert the
+            # same new row wait too.
+            list(
+                type(self.obj)
+                .objects.select_for_update()
+                .filter(pk=self.obj.pk)
+                .values_list("pk", flat=True)
             )
-            if entry.remove:
-                for perm in entry.perms:
-                    pval = p_dict.get(perm)
-                    if pval & bitfield:
-                        bitfield -= pval
-            else:
-                for perm in entry.perms:
-                    pval = p_dict.get(perm)
-                    bitfield = bitfield | pval
-            if entry.deny:
-                row.deny_permissions = bitfield
-            else:
-                row.allow_permissions = bitfield
-            row.save()
-            if row.allow_permissions == 0 and row.deny_permissions == 0:
-                row.delete()
+            rows = {
+                (row.identity_id, row.mode): row
+                for row in manager.filter(identity__in=identities).select_for_update()
+            }
+            before = {
+                key: (int(row.allow_permissions), int(row.deny_permissions))
+                for key, row in rows.items()
+            }
+            new_rows = dict()
+
+            for entry in entries:
+                mode = entry.mode if entry.mode else ""
+                key = (entry.identity.pk, mode)
+                if not (row := rows.get(key, None)):
+                    row = manager.model(
+                        identity=entry.identity,
+                        mode=mode,
+                        allow_permissions=0,
+                        deny_permissions=0,
+                        **{manager.field.name: self.obj},
+                    )
+                    rows[key] = new_rows[key] = row
+                bitfield = int(
+                    row.allow_permissions if not entry.deny else row.deny_permissions
+                )
+                if entry.remove:
+                    bitfield &= ~schema.mask(entry.perms)
+                else:
+                    bitfield |= schema.mask(entry.perms)
+                if entry.deny:
+                    row.deny_permissions = bitfield
+                else:
+                    row.allow_permissions = bitfield
+
+            create, update, delete = list(), list(), list()
+            for key, row in rows.items():
+                empty = row.allow_permissions == 0 and row.deny_permissions == 0
+                if key in new_rows:
+                    if not empty:
+                        create.append(row)
+                elif empty:
+                    delete.append(row.pk)
+                elif before[key] != (row.allow_permissions, row.deny_permissions):
+                    update.append(row)
+
+            if create:
+                manager.model.objects.bulk_create(create)
+            if update:
+                manager.model.objects.bulk_update(
+                    update, ["allow_permissions", "deny_permissions"]
+                )
+            if delete:
+                manager.filter(pk__in=delete).delete()
+        self.invalidate()
+
+        summary = {"created": len(create), "updated": len(update), "deleted": len(delete)}
+        if report_to:
+            report_to.msg(
+                f"ACL updated: {summary['created']} entries added, "
+                f"{summary['updated']} changed, {summary['deleted']} removed."
+            )
+        return summary
 
     def render_acl(self, looker=None):
         self.integrity_check()
+
+
+ACLHandler.compile_schema()
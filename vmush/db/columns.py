@@ -0,0 +1,162 @@
+from array import array
+from collections import Counter
+from itertools import accumulate
+from operator import attrgetter
+
+
+class ObjectColumns:
+    """
+    An array-backed index of the relationships between the objects of a PennDB.
+
+    Every relationship is an int32 column indexed by dbref, holding the target's dbref or
+    -1. Reverse lookups - contents, children, owns, zoned - are CSR-style: one array of
+    dbrefs sorted by target plus an array of offsets into it, so each query is a slice.
+    Those are built the first time a relationship is queried and dropped when its column
+    changes.
+
+    The arrays support the buffer protocol, so numpy.frombuffer() can wrap any of them
+    without copying.
+    """
+
+    fields = ("location", "exits", "parent", "owner", "zone", "type")
+
+    # reverse relationship name -> the column it is the reverse of.
+    reverse = {
+        "contents": "location",
+        "children": "parent",
+        "owns": "owner",
+        "zoned": "zone",
+    }
+
+    def __init__(self, objects: dict):
+        self.size = size = max(objects) + 1 if objects else 0
+        self.columns = dict()
+        self._csr = dict()
+
+        dbrefs = sorted(objects)
+        ordered = [objects[dbref] for dbref in dbrefs]
+        if len(dbrefs) == size:
+            # No gaps, which is usual: every column can be built straight from the objects.
+            self.present = bytearray(b"\x01") * size
+            for field in self.fields:
+                self.columns[field] = array("i", map(attrgetter(field), ordered))
+            return
+        self.present = present = bytearray(size)
+        for dbref in dbrefs:
+            present[dbref] = 1
+        for field in self.fields:
+            self.columns[field] = column = array("i", [-1]) * size
+            for dbref, value in zip(dbrefs, map(attrgetter(field), ordered)):
+                column[dbref] = value
+
+    def column(self, field: str) -> array:
+        return self.columns[field]
+
+    def exists(self, dbref: int) -> bool:
+        return 0 <= dbref < self.size and bool(self.present[dbref])
+
+    def get(self, field: str, dbref: int) -> int:
+        """
+        Returns the dbref that dbref's field points at, or -1 if it doesn't point at an
+        object in this database.
+        """
+        if not self.exists(dbref):
+            return -1
+        target = self.columns[field][dbref]
+        return target if self.exists(target) else -1
+
+    def set(self, field: str, dbref: int, value: int):
+        self.columns[field][dbref] = value
+        for relation, column in self.reverse.items():
+            if column == field:
+                self._csr.pop(relation, None)
+
+    def _build(self, field: str):
+        column = self.columns[field]
+        present = self.present
+        size = self.size
+
+        linked = [
+            dbref
+            for dbref in range(size)
+            if present[dbref] and 0 <= (target := column[dbref]) < size and present[target]
+        ]
+        # sorted() is stable, so each target's members stay in dbref order.
+        members = array("i", sorted(linked, key=column.__getitem__))
+        counts = [0] * size
+        for target, count in Counter(map(column.__getitem__, linked)).items():
+            counts[target] = count
+        offsets = array("i", accumulate(counts, initial=0))
+        return offsets, members
+
+    def related(self, relation: str, dbref: int) -> memoryview:
+        """
+        Returns the dbrefs of everything related to dbref, such as its contents or children,
+        in dbref order.
+        """
+        if not (csr := self._csr.get(relation, None)):
+            csr = self._build(self.reverse[relation])
+            self._csr[relation] = csr
+        offsets, members = csr
+        if not self.exists(dbref):
+            return memoryview(members)[0:0]
+        return memoryview(members)[offsets[dbref] : offsets[dbref + 1]]
+
+
+class RelationView:
+    """
+    What DbObject's contents, children, owns and zoned return when a PennDB uses the
+    columns index engine. It's made on access and iterates over the related objects
+    without storing them.
+    """
+
+    __slots__ = ("db", "relation", "id")
+
+    def __init__(self, db, relation: str, dbref: int):
+        self.db = db
+        self.relation = relation
+        self.id = dbref
+
+    def __iter__(self):
+        objects = self.db.objects
+        for dbref in self.db.columns.related(self.relation, self.id):
+            yield objects[dbref]
+
+    def __len__(self):
+        return len(self.db.columns.related(self.relation, self.id))
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __contains__(self, obj):
+        columns = self.db.columns
+        field = columns.reverse[self.relation]
+        return columns.exists(self.id) and columns.get(field, obj.id) == self.id
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.relation} of #{self.id}: {len(self)}>"
+
+
+class RelatedObjects:
+    """
+    The DbObject attribute for one reverse relationship, such as children.
+
+    Under the columns index engine it returns a RelationView onto the database's
+    ObjectColumns. Otherwise the object gets a set of its own the first time it's
+    asked for, which then shadows this attribute - so objects nothing points at never
+    allocate one.
+    """
+
+    def __init__(self, relation: str = None):
+        self.relation = relation
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        if self.relation and obj.db is not None and obj.db.columns is not None:
+            return RelationView(obj.db, self.relation, obj.id)
+        found = obj.__dict__[self.name] = set()
+        return found
@@ -0,0 +1,146 @@
+"""
+Compares two parsed PennMUSH databases - usually last night's outdb and tonight's.
+
+Objects are matched by objid (#dbref:created), so a dbref that was destroyed and reused
+shows up as one object deleted and another created. Changes are reported per field, per
+attribute and per lock.
+"""
+from typing import Dict, Iterator, Optional, Tuple
+
+from .flatfile import PennDB, DbObject
+
+
+class ObjectDiff:
+    """
+    How one object differs between two databases.
+
+    kind is "created", "deleted" or "modified". fields, attributes and locks map each
+    thing that changed to (old, new), where None means it isn't there on that side.
+    """
+
+    __slots__ = ("kind", "old", "new", "fields", "attributes", "locks")
+
+    # The DbObject fields compared. Relationships are compared as dbrefs.
+    compared = (
+        "name",
+        "type",
+        "location",
+        "exits",
+        "parent",
+        "owner",
+        "zone",
+        "pennies",
+        "flags",
+        "powers",
+        "warnings",
+        "modified",
+    )
+
+    def __init__(self, kind: str, old: Optional[DbObject], new: Optional[DbObject]):
+        self.kind = kind
+        self.old = old
+        self.new = new
+        self.fields: Dict[str, Tuple] = dict()
+        self.attributes: Dict[str, Tuple] = dict()
+        self.locks: Dict[str, Tuple] = dict()
+
+    def __repr__(self):
+        obj = self.new or self.old
+        return f"<{self.__class__.__name__} {self.kind} {obj.objid}>"
+
+    def __bool__(self):
+        return self.kind != "modified" or bool(self.fields or self.attributes or self.locks)
+
+    @property
+    def objid(self) -> str:
+        return (self.new or self.old).objid
+
+    @staticmethod
+    def attribute_state(attr):
+        return attr.value, attr.owner, attr.flags, attr.derefs
+
+    @staticmethod
+    def lock_state(lock):
+        return lock.key, lock.creator, lock.flags, lock.derefs
+
+    @staticmethod
+    def compare(old: dict, new: dict, state) -> Dict[str, Tuple]:
+        out = dict()
+        for name, item in old.items():
+            if (other := new.get(name, None)) is None:
+                out[name] = (item, None)
+            elif state(item) != state(other):
+                out[name] = (item, other)
+        for name, item in new.items():
+            if name not in old:
+                out[name] = (None, item)
+        return out
+
+    @classmethod
+    def between(cls, old: DbObject, new: DbObject):
+        """
+        Returns the ObjectDiff of two versions of the same object. It's falsy if they
+        are the same.
+        """
+        diff = cls("modified", old, new)
+        for field in cls.compared:
+            if (before := getattr(old, field)) != (after := getattr(new, field)):
+                diff.fields[field] = (before, after)
+        diff.attributes = cls.compare(old.attributes, new.attributes, cls.attribute_state)
+        diff.locks = cls.compare(old.locks, new.locks, cls.lock_state)
+        return diff
+
+
+def object_dbrefs(db: PennDB) -> list:
+    """
+    Every dbref in db, sorted, without parsing anything if db was opened lazily.
+    """
+    if db.object_index is not None:
+        return list(db.object_index.dbrefs)
+    return sorted(db.objects)
+
+
+def diff_databases(old: PennDB, new: PennDB) -> Iterator[ObjectDiff]:
+    """
+    Walks both databases in dbref order and yields an ObjectDiff for every object that
+    was created, deleted or modified between them.
+
+    Either database may have been opened with PennDB.open_indexed(), in which case its
+    objects are parsed as the walk reaches them.
+    """
+    old_refs = object_dbrefs(old)
+    new_refs = object_dbrefs(new)
+    i = j = 0
+    while i < len(old_refs) or j < len(new_refs):
+        old_ref = old_refs[i] if i < len(old_refs) else None
+        new_ref = new_refs[j] if j < len(new_refs) else None
+        if new_ref is None or (old_ref is not None and old_ref < new_ref):
+            yield ObjectDiff("deleted", old.load_object(old_ref), None)
+            i += 1
+            continue
+        if old_ref is None or new_ref < old_ref:
+            yield ObjectDiff("created", None, new.load_object(new_ref))
+            j += 1
+            continue
+        before = old.load_object(old_ref)
+        after = new.load_object(new_ref)
+        i += 1
+        j += 1
+        if before.created != after.created:
+            # the dbref was recycled.
+            yield ObjectDiff("deleted", before, None)
+            yield ObjectDiff("created", None, after)
+        elif diff := ObjectDiff.between(before, after):
+            yield diff
+
+
+def summarize(diffs) -> Dict[str, int]:
+    """
+    Counts the diffs of each kind, plus how many attributes and locks changed.
+    """
+    out = {"created": 0, "deleted": 0, "modified": 0, "attributes": 0, "locks": 0}
+    for diff in diffs:
+        out[diff.kind] += 1
+        out["attributes"] += len(diff.attributes)
+        out["locks"] += len(diff.locks)
+    return out
@@ -0,0 +1,285 @@
+"""
+Exports a parsed PennDB as columns, for analysis without re-parsing the outdb.
+
+Every table is a directory of NumPy .npy files, one per column, written with nothing
+but the standard library. numpy.load(path, mmap_mode="r") maps any of them without
+reading it into memory, and other tools can read the format directly: a short header
+followed by the raw little-endian values.
+
+Strings are stored the way Arrow stores them: <column>.data.npy holds the UTF-8 bytes of
+every value back to back, and <column>.offsets.npy holds n + 1 int64 offsets into it.
+Columns with few distinct values, such as flag and attribute names, are dictionary
+encoded instead: <column>.npy holds an int32 code per row, indexing the string column
+<column>.categories.
+
+Every table has a dbref column to join on. manifest.json lists the tables, their row
+counts and what kind each column is.
+
+Usage:
+    python -m vmush.db.export outdb directory
+"""
+import argparse
+import json
+import os
+import sys
+from array import array
+
+from .flatfile import PennDB
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def npy_header(descr: str, length: int) -> bytes:
+    """
+    The header of a version 1.0 .npy file holding a one-dimensional array.
+    """
+    text = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({length},), }}"
+    # The magic string, version and header length take 10 bytes, and the data has to
+    # start on a multiple of 64.
+    padding = 63 - (10 + len(text)) % 64
+    text = text + " " * padding + "\n"
+    return b"\x93NUMPY\x01\x00" + len(text).to_bytes(2, "little") + text.encode("latin_1")
+
+
+def write_npy(path: str, values):
+    """
+    Writes an array.array of i, q or B values, or a bytes-like of unsigned bytes, as .npy.
+    """
+    if isinstance(values, array):
+        descr = {"i": "i4", "q": "i8", "B": "u1"}[values.typecode]
+        if sys.byteorder != "little":
+            values = array(values.typecode, values)
+            values.byteswap()
+    else:
+        descr = "u1"
+    descr = ("|" if descr == "u1" else "<") + descr
+    with open(path, "wb") as f:
+        f.write(npy_header(descr, len(values)))
+        f.write(values)
+
+
+class StringColumn:
+    def __init__(self):
+        self.offsets = array("q", [0])
+        self.data = bytearray()
+
+    def append(self, value: str):
+        self.data += value.encode("utf-8", "surrogatepass")
+        self.offsets.append(len(self.data))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def write(self, directory: str, name: str):
+        write_npy(os.path.join(directory, f"{name}.offsets.npy"), self.offsets)
+        write_npy(os.path.join(directory, f"{name}.data.npy"), self.data)
+
+
+class CategoryColumn:
+    def __init__(self):
+        self.codes = array("i")
+        self.index = dict()
+
+    def append(self, value: str):
+        if (code := self.index.get(value, None)) is None:
+            code = self.index[value] = len(self.index)
+        self.codes.append(code)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def write(self, directory: str, name: str):
+        write_npy(os.path.join(directory, f"{name}.npy"), self.codes)
+        categories = StringColumn()
+        for value in self.index:
+            categories.append(value)
+        categories.write(directory, f"{name}.categories")
+
+
+class Table:
+    """
+    Columns filled a row at a time. columns maps each column's name to its kind: int32,
+    int64, string or category.
+    """
+
+    makers = {
+        "int32": lambda: array("i"),
+        "int64": lambda: array("q"),
+        "string": StringColumn,
+        "category": CategoryColumn,
+    }
+
+    def __init__(self, name: str, columns: dict):
+        self.name = name
+        self.kinds = columns
+        self.columns = {k: self.makers[v]() for k, v in columns.items()}
+        self.appenders = [c.append for c in self.columns.values()]
+
+    def append(self, *row):
+        for append, value in zip(self.appenders, row):
+            append(value)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values())))
+
+    def write(self, directory: str) -> dict:
+        out = os.path.join(directory, self.name)
+        os.makedirs(out, exist_ok=True)
+        for name, column in self.columns.items():
+            if isinstance(column, array):
+                write_npy(os.path.join(out, f"{name}.npy"), column)
+            else:
+                column.write(out, name)
+        return {"rows": len(self), "columns": dict(self.kinds)}
+
+
+def build_tables(db: PennDB) -> list:
+    objects = Table(
+        "objects",
+        {
+            "dbref": "int32",
+            "name": "string",
+            "type": "int32",
+            "location": "int32",
+            "exits": "int32",
+            "parent": "int32",
+            "owner": "int32",
+            "zone": "int32",
+            "pennies": "int64",
+            "created": "int64",
+            "modified": "int64",
+        },
+    )
+    attributes = Table(
+        "attributes",
+        {
+            "dbref": "int32",
+            "name": "category",
+            "owner": "int32",
+            "flags": "category",
+            "derefs": "int32",
+            "value": "string",
+        },
+    )
+    locks = Table(
+        "locks",
+        {
+            "dbref": "int32",
+            "name": "category",
+            "creator": "int32",
+            "flags": "category",
+            "derefs": "int32",
+            "key": "string",
+        },
+    )
+    flags = Table("flags", {"dbref": "int32", "flag": "category"})
+    powers = Table("powers", {"dbref": "int32", "power": "category"})
+
+    for dbref in sorted(db.objects):
+        obj = db.objects[dbref]
+        objects.append(
+            dbref,
+            obj.name,
+            obj.type,
+            obj.location,
+            obj.exits,
+            obj.parent,
+            obj.owner,
+            obj.zone,
+            obj.pennies,
+            obj.created,
+            obj.modified,
+        )
+        for name, attr in obj.attributes.items():
+            attributes.append(
+                dbref,
+                name,
+                attr.owner,
+                " ".join(sorted(attr.flags)),
+                attr.derefs,
+                attr.value.plain if attr.value else "",
+            )
+        for name, lock in obj.locks.items():
+            locks.append(
+                dbref, name, lock.creator, " ".join(sorted(lock.flags)), lock.derefs, lock.key
+            )
+        # An empty flags line parses as {""}, which isn't a flag.
+        for flag in sorted(obj.flags):
+            if flag:
+                flags.append(dbref, flag)
+        for power in sorted(obj.powers):
+            if power:
+                powers.append(dbref, power)
+
+    return [objects, attributes, locks, flags, powers]
+
+
+def export_columns(db: PennDB, directory: str) -> dict:
+    """
+    Writes db's objects, attributes, locks, flags and powers to directory as columns.
+
+    Returns:
+        the manifest, which is also saved as manifest.json.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = {"version": 1, "tables": dict()}
+    for table in build_tables(db):
+        manifest["tables"][table.name] = table.write(directory)
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_columns(directory: str, table: str) -> dict:
+    """
+    Memory-maps a table written by export_columns(). Needs numpy.
+
+    Returns:
+        {column: numpy array}. String columns become lists of str, and category columns
+        arrays of their values.
+    """
+    if numpy is None:
+        raise ImportError("load_columns() needs numpy. Install it with pip install numpy.")
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    path = os.path.join(directory, table)
+
+    def strings(name):
+        offsets = numpy.load(os.path.join(path, f"{name}.offsets.npy"), mmap_mode="r")
+        data = numpy.load(os.path.join(path, f"{name}.data.npy"), mmap_mode="r")
+        raw = data.tobytes()
+        return [
+            raw[offsets[i] : offsets[i + 1]].decode("utf-8", "surrogatepass")
+            for i in range(len(offsets) - 1)
+        ]
+
+    out = dict()
+    for name, kind in manifest["tables"][table]["columns"].items():
+        if kind == "string":
+            out[name] = strings(name)
+        elif kind == "category":
+            codes = numpy.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            out[name] = numpy.array(strings(f"{name}.categories"), dtype=object)[codes]
+        else:
+            out[name] = numpy.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export an outdb as columns.")
+    parser.add_argument("path", help="the PennMUSH outdb to export")
+    parser.add_argument("directory", help="where to write the columns")
+    args = parser.parse_args()
+
+    db = PennDB.from_outdb(args.path, cache=True)
+    manifest = export_columns(db, args.directory)
+    for name, table in manifest["tables"].items():
+        print(f"{name}: {table['rows']} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,21 @@
 import re
+import os
 import hashlib
+import pickle
+import mmap
 
+from array import array
+from bisect import bisect_left
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from enum import IntEnum
+from functools import lru_cache
+from itertools import repeat
 
 from mudrich.encodings.pennmush import decode
 
+from .columns import ObjectColumns, RelatedObjects
+
 from athanor.utils import partial_match
 
 
@@ -16,30 +26,61 @@ class ValType(IntEnum):
 
 
 class FlatLine:
+    """
+    A single logical line of a flatfile.
+
+    Only the raw text is stored up front. The other fields are __slots__ that start out
+    unset: the first time depth or name is read, the line is split, and the first time
+    value or valtype is read, the value is decoded. After that they're plain slot reads.
+    Lines that are skipped or only checked with text.startswith() cost next to nothing.
+    """
+
+    __slots__ = ("text", "header", "depth", "name", "value", "valtype", "_raw")
+
     def __init__(self, text: str):
         self.text = text
         self.header = text[0] in ("+", "~", "!", "*")
-        self.name = None
-        self.value = None
-        self.valtype: ValType = ValType.TEXT
-        self.depth = 0
-        if self.header:
-            if text.startswith("!"):
-                self.value = int(text[1:])
-                self.valtype = ValType.DBREF
+
+    def __getattr__(self, item):
+        if item in ("depth", "name", "_raw"):
+            self._split()
+        elif item in ("value", "valtype"):
+            self._decode()
         else:
-            self.depth = len(text) - len(text.lstrip(" "))
-            name, value = text.lstrip(" ").split(" ", 1)
-            self.name = name
-            if value.startswith('"'):
-                self.value = value[1:-1]
-                self.valtype = ValType.TEXT
-            elif value.startswith("#"):
-                self.value = int(value[1:])
+            raise AttributeError(item)
+        return object.__getattribute__(self, item)
+
+    def _split(self):
+        if self.header:
+            self.depth = 0
+            self.name = None
+            self._raw = None
+            return
+        text = self.text
+        stripped = text.lstrip(" ")
+        self.depth = len(text) - len(stripped)
+        self.name, self._raw = stripped.split(" ", 1)
+
+    def _decode(self):
+        if self.header:
+            if self.text.startswith("!"):
+                self.value = int(self.text[1:])
                 self.valtype = ValType.DBREF
             else:
-                self.value = int(value)
-                self.valtype = ValType.NUMBER
+                self.value = None
+                self.valtype = ValType.TEXT
+            return
+        value = self._raw
+        self._raw = None
+        if value.startswith('"'):
+            self.value = value[1:-1]
+            self.valtype = ValType.TEXT
+        elif value.startswith("#"):
+            self.value = int(value[1:])
+            self.valtype = ValType.DBREF
+        else:
+            self.value = int(value)
+            self.valtype = ValType.NUMBER
 
     def __repr__(self):
         return f'{self.__class__.__name__}: ({self.depth}) {self.name} "{self.value}"'
@@ -101,26 +142,411 @@ def parse_flatfile(path: str, chunk_size: int = 50):
         return None
 
 
+# Stop characters for the block tokenizer. Outside of a quoted value we only care about
+# the start of a quote or the end of a line; inside one, the end of the quote or an escape.
+# CR's are stops in both states so that CRLF and lone CR can be folded into LF the same way
+# Python's universal newlines would have done it for parse_flatfile.
+_RE_UNQUOTED_STOP = re.compile(r'["\r\n]')
+_RE_QUOTED_STOP = re.compile(r'["\\\r]')
+
+
+def _scan_line(block: str, pos: int, pieces: list, quoted: bool):
+    """
+    The slow path of FlatfileReader. Walks one logical line of block starting at pos,
+    appending its text to pieces, until the line ends or the block runs out.
+
+    Returns:
+        (pos, quoted, escaped, complete) - complete is True if the line ended.
+    """
+    end = len(block)
+    while pos < end:
+        if quoted:
+            if not (m := _RE_QUOTED_STOP.search(block, pos)):
+                pieces.append(block[pos:])
+                return end, True, False, False
+            i = m.start()
+            c = block[i]
+            if c == '"':
+                pieces.append(block[pos : i + 1])
+                quoted = False
+                pos = i + 1
+            elif c == "\r":
+                pieces.append(block[pos:i])
+                pieces.append("\n")
+                pos = i + 2 if block.startswith("\n", i + 1) else i + 1
+            else:
+                # a backslash. drop it and keep whatever it escapes.
+                pieces.append(block[pos:i])
+                i += 1
+                if i == end:
+                    return end, True, True, False
+                elif block[i] == "\r":
+                    pieces.append("\n")
+                    pos = i + 2 if block.startswith("\n", i + 1) else i + 1
+                else:
+                    pieces.append(block[i])
+                    pos = i + 1
+        else:
+            if not (m := _RE_UNQUOTED_STOP.search(block, pos)):
+                pieces.append(block[pos:])
+                return end, False, False, False
+            i = m.start()
+            if block[i] == '"':
+                pieces.append(block[pos : i + 1])
+                quoted = True
+                pos = i + 1
+            else:
+                pieces.append(block[pos:i])
+                if block[i] == "\r" and block.startswith("\n", i + 1):
+                    return i + 2, False, False, True
+                return i + 1, False, False, True
+    return pos, quoted, False, False
+
+
+class FlatfileReader:
+    """
+    A block-buffered replacement for parse_flatfile.
+
+    Reads the file in large binary blocks and splits them into lines in one go. Lines with
+    balanced quotes and no escapes - nearly all of them - are handed back as-is. Anything
+    else falls back to a scan that uses compiled regexes to jump between quotes, escapes and
+    newlines, building the logical line out of slices rather than one character at a time.
+    Either way, it produces exactly the same logical lines as parse_flatfile.
+
+    Iterating over the reader yields the lines. After each yielded line, .offset is the byte
+    offset of the start of the next line in the file.
+
+    start and end restrict the reader to a byte range of the file, which must begin at the
+    start of a line. Once the range is exhausted, .clean tells whether it also ended on a
+    line boundary outside of any quoted value.
+
+    source, if given, is an already open binary file - or an mmap of one - to read instead
+    of opening path.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        block_size: int = 1 << 20,
+        start: int = 0,
+        end: int = None,
+        source=None,
+    ):
+        self.path = path
+        self.source = source
+        self.block_size = block_size
+        self.start = start
+        self.end = end
+        self.offset = start
+        self.quoted = False
+        self.escaped = False
+        self.pending = ""
+
+    @property
+    def clean(self) -> bool:
+        return not (self.quoted or self.escaped or self.pending)
+
+    def __iter__(self):
+        if self.source is not None:
+            self.source.seek(self.start)
+            yield from self._tokenize(self.source)
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.start)
+            yield from self._tokenize(f)
+
+    def _blocks(self, f):
+        """
+        Yields (offset, text) for every block of the file, decoded as latin_1 so that
+        character positions are byte positions. A block never ends on a CR unless the
+        file does, so a CRLF is always seen whole.
+        """
+        offset = f.tell()
+        while True:
+            size = self.block_size
+            if self.end is not None:
+                size = min(size, self.end - offset)
+            if size <= 0 or not (data := f.read(size)):
+                break
+            while data.endswith(b"\r") and (extra := f.read(1)):
+                data += extra
+            yield offset, data.decode("latin_1")
+            offset += len(data)
+
+    def _tokenize(self, f):
+        pieces = list()
+        quoted = self.quoted
+        escaped = self.escaped
+
+        for base, block in self._blocks(f):
+            pos = 0
+            end = len(block)
+
+            if escaped:
+                escaped = False
+                if block[0] == "\r":
+                    pieces.append("\n")
+                    pos = 2 if block.startswith("\r\n") else 1
+                else:
+                    pieces.append(block[0])
+                    pos = 1
+
+            while pos < end:
+                if not quoted and not pieces and (last := block.rfind("\n", pos)) != -1:
+                    line_start = pos
+                    for line in block[pos:last].split("\n"):
+                        next_start = line_start + len(line) + 1
+                        if line_start < pos:
+                            # swallowed by a multi-line value the slow path just handled.
+                            line_start = next_start
+                            continue
+                        if line_start > pos:
+                            # a lone CR ended a line mid-split. Re-split from pos.
+                            break
+                        quotes = line.count('"')
+                        if (
+                            not quotes & 1
+                            and "\r" not in line
+                            and (not quotes or "\\" not in line)
+                        ):
+                            pos = next_start
+                            self.offset = base + pos
+                            yield line
+                        else:
+                            pos, quoted, escaped, complete = _scan_line(
+                                block, pos, pieces, False
+                            )
+                            if not complete:
+                                break
+                            self.offset = base + pos
+                            yield "".join(pieces)
+                            pieces.clear()
+                        line_start = next_start
+                    continue
+
+                pos, quoted, escaped, complete = _scan_line(block, pos, pieces, quoted)
+                if complete:
+                    self.offset = base + pos
+                    yield "".join(pieces)
+                    pieces.clear()
+
+        self.quoted = quoted
+        self.escaped = escaped
+        self.pending = "".join(pieces)
+
+
+# An object header such as !1234 followed by the name line that always opens an object block.
+# Used to pick shard boundaries.
+_RE_OBJECT_BOUNDARY = re.compile(rb'[\r\n]!\d+\r?[\r\n]name "')
+
+
+def _find_object_boundary(f, pos: int, end: int, window: int = 1 << 16) -> int:
+    """
+    Finds the offset of the first object header line that starts at or after pos.
+
+    This only looks at the raw bytes, so it can be fooled by a multi-line attribute value
+    that happens to contain such a line. Shards that were split at one of those are caught
+    by FlatfileReader.clean and parsed again together.
+    """
+    while pos < end:
+        f.seek(pos - 1)
+        data = f.read(window)
+        if not data:
+            break
+        if m := _RE_OBJECT_BOUNDARY.search(data):
+            return min(pos + m.start(), end)
+        # overlap the windows so a header that straddles two of them isn't missed.
+        pos += max(len(data) - 32, 1)
+    return end
+
+
+def _parse_object_shard(db_class, path: str, start: int, end: int):
+    """
+    Process pool entry point for PennDB.from_outdb. Parses the objects in one byte range of
+    the object section.
+
+    Returns:
+        (objects, clean) - clean is False if the range didn't end on a real object boundary.
+    """
+    db = db_class()
+    reader = FlatfileReader(path, start=start, end=end)
+    objects = list(db_class.parse_objects(db, parse_flatlines(reader)))
+    return objects, reader.clean
+
+
+# Either a whole quoted value, an object header line, or the end of the dump. Quoted values
+# are matched whole so that anything inside a multi-line value that looks like a header is
+# skipped over with it. Outside of values, an outdb never has a stray quote.
+_RE_INDEX_SCAN = re.compile(
+    rb'"[^"\\]*(?:\\.[^"\\]*)*"|[\r\n]!(\d+)(?=\r?[\r\n])|[\r\n](\*\*\*END OF DUMP)',
+    re.DOTALL,
+)
+
+
+class ObjectIndex:
+    """
+    The byte range of every object's block in a flatfile, sorted by dbref.
+
+    Built by one regex scan over the raw bytes, without tokenizing anything, and saved
+    next to the flatfile so that later runs can skip even that. The saved index records
+    the flatfile's inode, size, mtime and ctime, and is only reused if they all match:
+    a dump written to a new file and renamed into place has a new inode, and one
+    rewritten in place has a new ctime even if its mtime was put back.
+    """
+
+    version = 2
+
+    def __init__(self, dbrefs: array, starts: array, ends: array):
+        self.dbrefs = dbrefs
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self):
+        return len(self.dbrefs)
+
+    @classmethod
+    def scan(cls, data):
+        """
+        Indexes the objects in data, the whole flatfile as bytes or an mmap.
+        """
+        found = list()
+        end = len(data)
+        for m in _RE_INDEX_SCAN.finditer(data):
+            if m.group(1) is not None:
+                found.append((int(m.group(1)), m.start() + 1))
+            elif m.group(2) is not None:
+                end = m.start(2)
+                break
+        found.sort()
+        dbrefs = array("i", [f[0] for f in found])
+        starts = array("q", [f[1] for f in found])
+        # each block ends where the next one in the file starts.
+        by_position = sorted(starts)
+        following = dict(zip(by_position, by_position[1:] + [end]))
+        ends = array("q", [following[start] for start in starts])
+        return cls(dbrefs, starts, ends)
+
+    def find(self, dbref: int):
+        """
+        Returns (start, end) of dbref's block, or None if there's no such object.
+        """
+        i = bisect_left(self.dbrefs, dbref)
+        if i < len(self.dbrefs) and self.dbrefs[i] == dbref:
+            return self.starts[i], self.ends[i]
+        return None
+
+    @staticmethod
+    def index_path(path: str) -> str:
+        return f"{path}.index"
+
+    @classmethod
+    def file_key(cls, path: str) -> dict:
+        st = os.stat(path)
+        return {
+            "version": cls.version,
+            "inode": (st.st_dev, st.st_ino),
+            "size": st.st_size,
+            "mtime": st.st_mtime_ns,
+            "ctime": st.st_ctime_ns,
+        }
+
+    def save(self, path: str):
+        header = self.file_key(path)
+        index = self.index_path(path)
+        scratch = f"{index}.tmp"
+        with open(scratch, "wb") as f:
+            pickle.dump(header, f, protocol=5)
+            pickle.dump((self.dbrefs, self.starts, self.ends), f, protocol=5)
+        os.replace(scratch, index)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Loads the index saved for a flatfile by save().
+
+        Returns:
+            ObjectIndex, or None if there is none or the flatfile has changed since.
+        """
+        index = cls.index_path(path)
+        if not os.path.exists(index):
+            return None
+        key = cls.file_key(path)
+        try:
+            with open(index, "rb") as f:
+                if pickle.load(f) != key:
+                    return None
+                return cls(*pickle.load(f))
+        except Exception:
+            return None
+
+
+@lru_cache(maxsize=4096)
+def flag_set(value: str) -> frozenset:
+    """
+    Turns a space-separated list of flags, powers or warnings into a frozenset.
+
+    The same few flag strings repeat across hundreds of thousands of objects and
+    attributes, so every identical string shares one frozenset.
+    """
+    return frozenset(value.split(" "))
+
+
+# Characters that end the literal prefix of an lattr() pattern.
+_ATTR_PATTERN_SPECIAL = frozenset("*?[](){}.+^$|\\")
+_ATTR_PATTERN_QUANTIFIERS = frozenset("?{")
+
+
+@lru_cache(maxsize=256)
+def compile_attr_pattern(pattern: str):
+    """
+    Compiles a MUSH-style attribute wildcard pattern such as COBJ`* into a regex.
+
+    Returns:
+        (compiled regex, prefix) - prefix is the uppercased literal text every match
+            starts with, and may be empty.
+    """
+    regex = pattern.replace("`**", "`\S+").replace("*", "\w+")
+    prefix = list()
+    if "|" not in pattern:
+        for c in pattern:
+            if c in _ATTR_PATTERN_SPECIAL:
+                # These can make the character before them optional.
+                if c in _ATTR_PATTERN_QUANTIFIERS and prefix:
+                    prefix.pop()
+                break
+            prefix.append(c)
+    return re.compile(f"^{regex}$", flags=re.IGNORECASE), "".join(prefix).upper()
+
+
 class Flag:
     def __init__(self, name):
         self.name = name
         self.letter = ""
-        self.type = set()
-        self.perms = set()
-        self.negate_perms = set()
+        self.type = frozenset()
+        self.perms = frozenset()
+        self.negate_perms = frozenset()
         self.aliases = set()
 
         self.objects = set()
 
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop("objects", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.objects = set()
+
     def set_line(self, line: FlatLine):
         if line.name == "letter":
             self.letter = line.value
         elif line.name == "type":
-            self.type = set(line.value.split(" "))
+            self.type = flag_set(line.value)
         elif line.name == "perms":
-            self.perms = set(line.value.split(" "))
+            self.perms = flag_set(line.value)
         elif line.name == "negate_perms":
-            self.negate_perms = set(line.value.split(" "))
+            self.negate_perms = flag_set(line.value)
         elif line.name == "alias":
             self.aliases.add(line.value)
 
@@ -128,14 +554,14 @@ class Flag:
 class Attribute:
     def __init__(self, name):
         self.name = name
-        self.flags = set()
+        self.flags = frozenset()
         self.creator = -1
         self.data = ""
         self.aliases = set()
 
     def set_line(self, line: FlatLine):
         if line.name == "flags":
-            self.flags = set(line.value.split(" "))
+            self.flags = flag_set(line.value)
         elif line.name == "creator":
             self.creator = line.value
         elif line.name == "data":
@@ -147,7 +573,7 @@ class ObjAttribute:
         self.name = name
         self.value = ""
         self.owner = -1
-        self.flags = set()
+        self.flags = frozenset()
         self.derefs = -1
 
     def set_line(self, line: FlatLine):
@@ -155,7 +581,7 @@ class ObjAttribute:
         if line.name == "owner":
             self.owner = line.value
         elif line.name == "flags":
-            self.flags = set(line.value.split(" "))
+            self.flags = flag_set(line.value)
         elif line.name == "derefs":
             self.derefs = line.value
         elif line.name == "value":
@@ -166,7 +592,7 @@ class ObjLock:
     def __init__(self, name):
         self.name = name
         self.creator = -1
-        self.flags = set()
+        self.flags = frozenset()
         self.derefs = -1
         self.key = ""
 
@@ -174,9 +600,11 @@ class ObjLock:
         if line.name == "creator":
             self.creator = line.value
         elif line.name == "flags":
-            self.flags = set(line.value.split(" "))
+            self.flags = flag_set(line.value)
         elif line.name == "derefs":
             self.derefs = line.value
+        elif line.name == "key":
+            self.key = line.value
         elif line.name == "value":
             self.value = line.value
 
@@ -194,24 +622,56 @@ class DbObject:
         self.zone = -1
         self.pennies = 0
         self.type = -1
-        self.flags = set()
-        self.powers = set()
-        self.warnings = set()
+        self.flags = frozenset()
+        self.powers = frozenset()
+        self.warnings = frozenset()
         self.created = -1
         self.modified = -1
         self.attributes = dict()
         self.locks = dict()
 
-        self.children = set()
-        self.contents = set()
-        self.entrances = set()
         self.parent_obj = None
         self.owner_obj = None
         self.zone_obj = None
         self.location_obj = None
         self.exits_obj = None
-        self.owns = set()
-        self.zoned = set()
+
+        self._attr_index = None
+        self._inherited = None
+        self._inherited_generation = -1
+
+    # The reverse relationships, filled in by PennDB.setup().
+    children = RelatedObjects("children")
+    contents = RelatedObjects("contents")
+    owns = RelatedObjects("owns")
+    zoned = RelatedObjects("zoned")
+    entrances = RelatedObjects()
+
+    # Everything PennDB.setup() fills in. These are left out when pickling and rebuilt by
+    # setup() instead, which also keeps pickle from recursing through the whole object graph.
+    derived_fields = (
+        "db",
+        "children",
+        "contents",
+        "entrances",
+        "parent_obj",
+        "owner_obj",
+        "zone_obj",
+        "location_obj",
+        "exits_obj",
+        "owns",
+        "zoned",
+        "_attr_index",
+        "_inherited",
+        "_inherited_generation",
+    )
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if k not in self.derived_fields}
+
+    def __setstate__(self, state):
+        self.__init__(None, state["id"])
+        self.__dict__.update(state)
 
     def __repr__(self):
         return f"<DbObj {self.type} - {self.dbref}: {self.name}>"
@@ -272,11 +732,11 @@ class DbObject:
         elif line.name == "type":
             self.type = line.value
         elif line.name == "flags":
-            self.flags = set(line.value.split(" "))
+            self.flags = flag_set(line.value)
         elif line.name == "powers":
-            self.powers = set(line.value.split(" "))
+            self.powers = flag_set(line.value)
         elif line.name == "warnings":
-            self.warnings = set(line.value.split(" "))
+            self.warnings = flag_set(line.value)
         elif line.name == "created":
             self.created = line.value
         elif line.name == "modified":
@@ -290,25 +750,128 @@ class DbObject:
             return found
         else:
             if inherit and self.parent_obj:
-                return self.parent_obj.get(uattr, default=default)
+                if self.db is not None and self.db.flatten_inheritance:
+                    return self.inherited_attributes().get(uattr, default)
+                for ancestor in self.ancestors():
+                    if (found := ancestor.attributes.get(uattr, None)) :
+                        return found
         return default
 
     def ancestors(self, reversed=False):
+        """
+        Returns this object's parent, grandparent, and so on. A parent loop ends the list
+        at the first object that would repeat.
+        """
         out = list()
-        if self.parent_obj:
-            parent = self.parent_obj
+        seen = {self.id}
+        parent = self.parent_obj
+        while parent and parent.id not in seen:
+            seen.add(parent.id)
             out.append(parent)
-            while (parent := parent.parent_obj) :
-                out.append(parent)
+            parent = parent.parent_obj
         if reversed:
             out.reverse()
         return out
 
+    def inherited_attributes(self):
+        """
+        Returns a dict of every attribute this object has or inherits, as get() would
+        resolve them.
+
+        The table is built on first use from the parent's table, which is built the same
+        way, so a whole parent chain is only ever flattened once. Tables are dropped when
+        the database's inheritance generation changes - see PennDB.invalidate_inheritance().
+        """
+        generation = self.db.inherit_generation if self.db is not None else 0
+        if self._inherited_generation == generation:
+            return self._inherited
+
+        pending = [self]
+        seen = {self.id}
+        table = None
+        parent = self.parent_obj
+        while parent:
+            if parent._inherited_generation == generation:
+                table = parent._inherited
+                break
+            if parent.id in seen:
+                # A parent loop. Intermediate tables would depend on where the loop was
+                # entered from, so only this object's own table is kept.
+                table = dict()
+                for ancestor in self.ancestors(reversed=True):
+                    table.update(ancestor.attributes)
+                table.update(self.attributes)
+                self._inherited = table
+                self._inherited_generation = generation
+                return table
+            seen.add(parent.id)
+            pending.append(parent)
+            parent = parent.parent_obj
+
+        for obj in reversed(pending):
+            if table is None:
+                # Nothing to inherit, so the object's own attributes will do as they are.
+                table = obj.attributes
+            else:
+                table = dict(table)
+                table.update(obj.attributes)
+            obj._inherited = table
+            obj._inherited_generation = generation
+        return table
+
+    def set_parent(self, parent):
+        """
+        Changes this object's parent, keeping the links setup() made and any inherited
+        attribute tables in order.
+        """
+        self.parent = parent.id if parent else -1
+        if self.db is not None and self.db.columns is not None:
+            self.db.columns.set("parent", self.id, self.parent)
+        else:
+            if self.parent_obj:
+                self.parent_obj.children.discard(self)
+            if parent:
+                parent.children.add(self)
+        self.parent_obj = parent
+        if self.db is not None:
+            self.db.invalidate_inheritance()
+
+    def attribute_index(self):
+        """
+        Returns a sorted list of (uppercased name, name) for this object's attributes. It's
+        built on first use, so call invalidate_attributes() after changing .attributes.
+        """
+        if self._attr_index is None:
+            self._attr_index = sorted((k.upper(), k) for k in self.attributes)
+        return self._attr_index
+
+    def invalidate_attributes(self):
+        self._attr_index = None
+        if self.db is not None:
+            self.db.invalidate_inheritance()
+
+    def match_attributes(self, pattern, prefix=""):
+        """
+        Yields (name, attribute) for every attribute of this object matching a compiled
+        pattern. If a literal prefix is given, only attributes starting with it are visited.
+        """
+        if not prefix:
+            for k, v in self.attributes.items():
+                if pattern.match(k):
+                    yield k, v
+            return
+        index = self.attribute_index()
+        for i in range(bisect_left(index, (prefix,)), len(index)):
+            upper, k = index[i]
+            if not upper.startswith(prefix):
+                break
+            if pattern.match(k):
+                yield k, self.attributes[k]
+
     def lattr(self, pattern, inherit=False):
         if not pattern:
             return dict()
-        pattern = pattern.replace("`**", "`\S+").replace("*", "\w+")
-        re_pattern = re.compile(f"^{pattern}$", flags=re.IGNORECASE)
+        re_pattern, prefix = compile_attr_pattern(pattern)
         out = dict()
         if inherit:
             ancestors = self.ancestors(reversed=True)
@@ -316,9 +879,7 @@ class DbObject:
         else:
             ancestors = [self]
         for ancestor in ancestors:
-            out.update(
-                {k: v for k, v in ancestor.attributes.items() if re_pattern.match(k)}
-            )
+            out.update(ancestor.match_attributes(re_pattern, prefix))
         return out
 
     def lattrp(self, pattern):
@@ -328,6 +889,14 @@ class DbObject:
 class PennDB:
     obj_class = DbObject
     attr_class = ObjAttribute
+    snapshot_version = 3
+    # Whether DbObject.get() resolves inherited attributes through flattened, memoized
+    # tables rather than walking the parent chain every time.
+    flatten_inheritance = True
+    # How setup() indexes relationships. "sets" keeps a set of objects on both sides of
+    # every relationship. "columns" keeps them in an ObjectColumns index instead, and
+    # DbObject's contents, children, owns and zoned return RelationViews onto it.
+    index_engine = "sets"
 
     def __init__(self):
         self.bitflags = 0
@@ -341,8 +910,28 @@ class PennDB:
         self.type_index = defaultdict(set)
         self.dbrefs = dict()
         self.objids = dict()
+        self.names = dict()
+        self.name_keys = list()
+        self.inherit_generation = 0
+        self.columns = None
+        self.object_count = 0
+        # Set by open_indexed(): objects are then parsed from outdb, an mmap of the
+        # flatfile at path, one at a time.
+        self.object_index = None
+        self.outdb = None
+        self.path = None
+
+    def invalidate_inheritance(self):
+        """
+        Drops every inherited attribute table. Call this after changing attributes or
+        parents by hand.
+        """
+        self.inherit_generation += 1
 
     def setup(self):
+        if self.index_engine == "columns":
+            self.setup_columns()
+            return
         for k, v in self.objects.items():
             self.type_index[v.type].add(v)
 
@@ -376,19 +965,98 @@ class PennDB:
             self.dbrefs[v.dbref] = v
             self.objids[v.objid] = v
 
-    @classmethod
-    def from_outdb(cls, path: str):
-        db = cls()
+        self.index_names()
+        self.invalidate_inheritance()
+
+    def setup_columns(self):
+        """
+        The columns version of setup(). Builds an ObjectColumns index, then does the rest
+        of setup() except filling in the reverse relationships, which read the index.
+        """
+        self.columns = ObjectColumns(self.objects)
+        objects = self.objects
+
+        for k, v in objects.items():
+            self.type_index[v.type].add(v)
+
+            v.location_obj = objects.get(v.location, None)
+            v.exits_obj = objects.get(v.exits, None)
+            v.parent_obj = objects.get(v.parent, None)
+            v.zone_obj = objects.get(v.zone, None)
+            v.owner_obj = objects.get(v.owner, None)
+
+            for fname in v.flags:
+                if (flag := self.flags.get(fname, None)) :
+                    flag.objects.add(v)
+
+            for pname in v.powers:
+                if (flag := self.powers.get(pname, None)) :
+                    flag.objects.add(v)
+
+            self.dbrefs[v.dbref] = v
+            self.objids[v.objid] = v
+
+        self.index_names()
+        self.invalidate_inheritance()
+
+    def index_names(self):
+        """
+        Indexes every object by its lowercased name for find_name(). setup() calls this;
+        call it again after renaming objects.
+        """
+        names = dict()
+        for obj in self.objects.values():
+            if (found := names.get(key := obj.name.lower(), None)) :
+                found.append(obj)
+            else:
+                names[key] = [obj]
+        self.names = names
+        self.name_keys = sorted(names)
+
+    def find_name(self, name: str, exact: bool = False):
+        """
+        Finds an object by name, ignoring case.
+
+        Without exact, a name that is only the start of an object's name matches too. Like
+        athanor's partial_match(), the shortest matching name wins, and between objects
+        whose names are equally long, the one with the lowest dbref.
+
+        Returns:
+            DbObject or None.
+        """
+        prefix = name.lower()
+        if (found := self.names.get(prefix, None)) :
+            return found[0]
+        if exact:
+            return None
+        keys = self.name_keys
+        best = None
+        for i in range(bisect_left(keys, prefix), len(keys)):
+            if not (key := keys[i]).startswith(prefix):
+                break
+            if best is None or len(key) < len(best):
+                best = key
+            elif len(key) == len(best):
+                if self.names[key][0].id < self.names[best][0].id:
+                    best = key
+        return self.names[best][0] if best is not None else None
+
+    def read_tables(self, lines):
+        """
+        Reads everything in a flatfile that comes before the objects: the header, flags,
+        powers and attributes. Stops right after the line that opens the object section,
+        so the same lines can then be handed to parse_objects().
+
+        Args:
+            lines (iterator of FlatLine): the flatfile, from the start.
+        """
         flag_cur = None
         attr_cur = None
         section = "header"
 
         header_section = list()
-        obj_storage = defaultdict(list)
-        cur_obj = -1
-
-        for i, line in enumerate(parse_flatlines(parse_flatfile(path))):
 
+        for line in lines:
             if section == "header":
                 if line.text.startswith(("+V-")):
                     header_section.append(line)
@@ -405,20 +1073,20 @@ class PennDB:
                         flags_left = int(line.value)
                     if line.name == "flagaliascount":
                         if flag_cur:
-                            db.flags[flag_cur.name] = flag_cur
+                            self.flags[flag_cur.name] = flag_cur
                         flag_alias_left = int(line.value)
                         section = "flagaliases"
                         flag_cur = None
                 if line.depth == 1 and line.name == "name":
                     if flag_cur:
-                        db.flags[flag_cur.name] = flag_cur
+                        self.flags[flag_cur.name] = flag_cur
                     flag_cur = Flag(line.value)
                 if line.depth == 2:
                     flag_cur.set_line(line)
 
             if section == "flagaliases":
                 if line.depth == 1 and line.name == "name":
-                    flag_cur = db.flags.get(line.name, None)
+                    flag_cur = self.flags.get(line.name, None)
                 if line.depth == 2 and line.name == "alias" and flag_cur:
                     flag_cur.set_line(line)
                 if line.depth == 0 and line.text.startswith("+POWER"):
@@ -431,20 +1099,20 @@ class PennDB:
                         powers_left = int(line.value)
                     if line.name == "flagaliascount":
                         if flag_cur:
-                            db.powers[flag_cur.name] = flag_cur
+                            self.powers[flag_cur.name] = flag_cur
                         power_alias_left = int(line.value)
                         section = "poweraliases"
                         flag_cur = None
                 if line.depth == 1 and line.name == "name":
                     if flag_cur:
-                        db.powers[flag_cur.name] = flag_cur
+                        self.powers[flag_cur.name] = flag_cur
                     flag_cur = Flag(line.value)
                 if line.depth == 2:
                     flag_cur.set_line(line)
 
             if section == "poweraliases":
                 if line.depth == 1 and line.name == "name":
-                    flag_cur = db.powers.get(line.name, None)
+                    flag_cur = self.powers.get(line.name, None)
                 if line.depth == 2 and line.name == "alias" and flag_cur:
                     flag_cur.set_line(line)
                 if line.depth == 0 and line.text.startswith("+ATTRIBUTES"):
@@ -457,12 +1125,12 @@ class PennDB:
                         attr_left = int(line.value)
                     if line.name == "attraliascount":
                         if attr_cur:
-                            db.attributes[attr_cur.name] = attr_cur
+                            self.attributes[attr_cur.name] = attr_cur
                         attr_alias_left = int(line.value)
                         section = "attraliases"
                 if line.depth == 1 and line.name == "name":
                     if attr_cur:
-                        db.attributes[attr_cur.name] = attr_cur
+                        self.attributes[attr_cur.name] = attr_cur
                     attr = Attribute(line.value)
                     attr_cur = attr
                 if line.depth == 2:
@@ -470,36 +1138,323 @@ class PennDB:
 
             if section == "attraliases":
                 if line.depth == 1 and line.name == "name":
-                    flag_cur = db.powers.get(line.name, None)
+                    flag_cur = self.powers.get(line.name, None)
                 if line.depth == 2 and line.name == "alias" and flag_cur:
                     flag_cur.set_line(line)
                 if line.depth == 0 and line.text.startswith("~"):
                     section = "objects"
                     attr_cur = None
-
-            if section == "objects":
-                if line.depth == 0 and line.header:
-                    cur_obj = line.value
-                elif line.depth == 0 and line.text.startswith("***END OF DUMP"):
+                    if line.text[1:].isdigit():
+                        self.object_count = int(line.text[1:])
                     break
-                else:
-                    obj_storage[cur_obj].append(line)
 
-        for k, v in obj_storage.items():
-            db.objects[k] = cls.obj_class.from_lines(db, k, v)
+    @classmethod
+    def parse_objects(cls, db, lines):
+        """
+        Builds DbObjects out of the object section of a flatfile.
+
+        Each object is built as soon as its block ends, so only one object's worth of lines
+        is ever held in memory.
+
+        Args:
+            db (PennDB): the database the objects will belong to.
+            lines (iterable of FlatLine): the object section, starting at an object header.
+
+        Returns:
+            generator of DbObjects, in file order.
+        """
+        obj_lines = list()
+        cur_obj = -1
+
+        for line in lines:
+            if line.header:
+                if obj_lines:
+                    yield cls.obj_class.from_lines(db, cur_obj, obj_lines)
+                    obj_lines = list()
+                if line.text.startswith("***END OF DUMP"):
+                    return
+                cur_obj = line.value
+            else:
+                obj_lines.append(line)
+
+        if obj_lines:
+            yield cls.obj_class.from_lines(db, cur_obj, obj_lines)
+
+    @classmethod
+    def parse_objects_parallel(cls, path: str, start: int, workers: int):
+        """
+        Parses the object section of a flatfile in a process pool.
+
+        The section is split into byte ranges at object headers and each range is parsed on
+        its own. A range that doesn't end cleanly was split inside a multi-line value, so it
+        is parsed again together with the range after it.
+
+        Args:
+            path (path-like): the flatfile.
+            start (int): byte offset of the first object header.
+            workers (int): how many processes to use.
+
+        Returns:
+            list of DbObjects, in file order.
+        """
+        end = os.path.getsize(path)
+        shards = max(1, min(workers * 4, (end - start) // (1 << 20)))
+        bounds = [start]
+        with open(path, "rb") as f:
+            for k in range(1, shards):
+                pos = _find_object_boundary(f, start + (end - start) * k // shards, end)
+                if bounds[-1] < pos < end:
+                    bounds.append(pos)
+        bounds.append(end)
+        ranges = list(zip(bounds, bounds[1:]))
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(
+                pool.map(
+                    _parse_object_shard,
+                    repeat(cls),
+                    repeat(path),
+                    [r[0] for r in ranges],
+                    [r[1] for r in ranges],
+                )
+            )
+
+        out = list()
+        i = 0
+        while i < len(ranges):
+            objects, clean = results[i]
+            shard_start = ranges[i][0]
+            while not clean and i + 1 < len(ranges):
+                i += 1
+                objects, clean = _parse_object_shard(
+                    cls, path, shard_start, ranges[i][1]
+                )
+            out.extend(objects)
+            i += 1
+        return out
+
+    @staticmethod
+    def snapshot_path(path: str) -> str:
+        return f"{path}.snapshot"
+
+    @staticmethod
+    def snapshot_key(path: str) -> dict:
+        """
+        Identifies the exact contents of a flatfile: its size, mtime and a hash of its bytes.
+        """
+        st = os.stat(path)
+        check = hashlib.blake2b(digest_size=20)
+        with open(path, "rb") as f:
+            while data := f.read(1 << 20):
+                check.update(data)
+        return {"size": st.st_size, "mtime": st.st_mtime_ns, "hash": check.hexdigest()}
+
+    def save_snapshot(self, path: str, snapshot: str = None):
+        """
+        Saves this parsed database next to the flatfile it was loaded from, so that
+        load_snapshot() can skip parsing it next time. snapshot saves it somewhere else
+        instead, to be loaded with read_snapshot().
+
+        Only the parsed data is saved. Everything setup() builds is rebuilt on load.
+        """
+        header = {"version": self.snapshot_version, "class": self.__class__.__qualname__}
+        header.update(self.snapshot_key(path))
+        body = {
+            "bitflags": self.bitflags,
+            "dbversion": self.dbversion,
+            "savetime": self.savetime,
+            "object_count": self.object_count,
+            "flags": self.flags,
+            "powers": self.powers,
+            "attributes": self.attributes,
+            "objects": self.objects,
+        }
+        snapshot = snapshot or self.snapshot_path(path)
+        scratch = f"{snapshot}.tmp"
+        with open(scratch, "wb") as f:
+            pickle.dump(header, f, protocol=5)
+            pickle.dump(body, f, protocol=5)
+        os.replace(scratch, snapshot)
+
+    @classmethod
+    def load_snapshot(cls, path: str):
+        """
+        Loads the snapshot saved for a flatfile by save_snapshot().
+
+        Snapshots are pickles, so only load ones this program wrote itself.
+
+        Returns:
+            PennDB, or None if there is no snapshot or it's stale.
+        """
+        snapshot = cls.snapshot_path(path)
+        if not os.path.exists(snapshot):
+            return None
+        st = os.stat(path)
+        try:
+            with open(snapshot, "rb") as f:
+                header = pickle.load(f)
+                if (
+                    header.get("version") != cls.snapshot_version
+                    or header.get("class") != cls.__qualname__
+                    or header.get("size") != st.st_size
+                    or header.get("mtime") != st.st_mtime_ns
+                    or header.get("hash") != cls.snapshot_key(path)["hash"]
+                ):
+                    return None
+                body = pickle.load(f)
+        except Exception:
+            # A truncated or otherwise unreadable snapshot is just as stale as an old one.
+            return None
+        return cls.from_snapshot_body(body)
+
+    @classmethod
+    def read_snapshot(cls, snapshot: str):
+        """
+        Loads a snapshot file without checking it against the flatfile it came from,
+        which may well have been replaced since.
+
+        Returns:
+            PennDB, or None if the snapshot is missing, unreadable or from another version.
+        """
+        try:
+            with open(snapshot, "rb") as f:
+                header = pickle.load(f)
+                if (
+                    header.get("version") != cls.snapshot_version
+                    or header.get("class") != cls.__qualname__
+                ):
+                    return None
+                body = pickle.load(f)
+        except Exception:
+            return None
+        return cls.from_snapshot_body(body)
+
+    @classmethod
+    def from_snapshot_body(cls, body: dict):
+        db = cls()
+        db.bitflags = body["bitflags"]
+        db.dbversion = body["dbversion"]
+        db.savetime = body["savetime"]
+        db.object_count = body["object_count"]
+        db.flags = body["flags"]
+        db.powers = body["powers"]
+        db.attributes = body["attributes"]
+        db.objects = body["objects"]
+        for obj in db.objects.values():
+            obj.db = db
+        db.setup()
+        return db
+
+    @classmethod
+    def from_outdb(cls, path: str, workers: int = None, cache: bool = False):
+        """
+        Loads a PennMUSH flatfile.
+
+        Args:
+            path (path-like): the flatfile to load.
+            workers (int): if more than 1, objects are parsed in a pool of this many
+                processes. The result is the same either way.
+            cache (bool): use the snapshot saved next to the flatfile if it's up to date,
+                and save a new one if it's not.
+
+        Returns:
+            PennDB
+        """
+        if cache and (db := cls.load_snapshot(path)):
+            return db
+
+        db = cls()
+        reader = FlatfileReader(path)
+        lines = parse_flatlines(reader)
+        db.read_tables(lines)
+
+        if workers and workers > 1:
+            objects = cls.parse_objects_parallel(path, reader.offset, workers)
+        else:
+            objects = cls.parse_objects(db, lines)
+
+        for obj in objects:
+            obj.db = db
+            db.objects[obj.id] = obj
 
         db.setup()
+        if cache:
+            db.save_snapshot(path)
+        return db
+
+    @classmethod
+    def open_indexed(cls, path: str):
+        """
+        Opens a PennMUSH flatfile lazily. Only the flags, powers and attribute tables are
+        read up front. Objects are parsed one at a time, the first time find_obj(),
+        isdbref() or isobjid() asks for them, straight out of an mmap of the file.
+
+        Where each object is comes from an ObjectIndex, which is saved next to the file
+        the first time and reused after that.
+
+        An object's parent chain is loaded along with it, so get() still inherits. Its
+        other relationships - contents, children, owner_obj and so on - are left unset.
+
+        Returns:
+            PennDB. Call close() when done with it, or use it as a context manager.
+        """
+        db = cls()
+        with open(path, "rb") as f:
+            db.outdb = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # read_tables() stops at the objects, leaving the reader suspended. Reading the
+        # mmap rather than opening the file again means that leaves no file handle open.
+        db.read_tables(parse_flatlines(FlatfileReader(path, source=db.outdb)))
+        if (index := ObjectIndex.load(path)) is None:
+            index = ObjectIndex.scan(db.outdb)
+            index.save(path)
+        db.object_index = index
+        db.path = path
         return db
 
+    def close(self):
+        if self.outdb is not None:
+            self.outdb.close()
+            self.outdb = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def load_object(self, dbref: int):
+        """
+        Returns the object with this dbref. A database opened with open_indexed() parses
+        it first if it hasn't already.
+        """
+        if (found := self.objects.get(dbref, None)) is not None:
+            return found
+        if self.object_index is None or not (span := self.object_index.find(dbref)):
+            return None
+        start, end = span
+        reader = FlatfileReader(self.path, start=start, end=end, source=self.outdb)
+        for obj in self.parse_objects(self, parse_flatlines(reader)):
+            self.objects[obj.id] = obj
+            self.dbrefs[obj.dbref] = obj
+            self.objids[obj.objid] = obj
+            obj.parent_obj = self.load_object(obj.parent)
+        return self.objects.get(dbref, None)
+
     def isdbref(self, dbref):
-        return self.dbrefs.get(dbref, None)
+        if (found := self.dbrefs.get(dbref, None)) is None and self.object_index:
+            if dbref.startswith("#") and dbref[1:].isdigit():
+                found = self.load_object(int(dbref[1:]))
+        return found
 
     def isobjid(self, objid):
-        return self.objids.get(objid, None)
+        if (found := self.objids.get(objid, None)) is None and self.object_index:
+            if (obj := self.isdbref(objid.split(":", 1)[0])) and obj.objid == objid:
+                found = obj
+        return found
 
     def find_obj(self, dbref):
         if isinstance(dbref, int):
-            return self.objects.get(dbref, None)
+            return self.load_object(dbref)
         if not dbref:
             return None
         if ":" in dbref:
@@ -1,44 +1,84 @@
-from athanor.utils import partial_match
+import asyncio
+import fcntl
+import os
+import pickle
+import threading
+import time
 from pymush.utils.text import truthy
-from .flatfile import PennDB
+from .flatfile import PennDB, FlatfileReader, parse_flatlines
+from .diff import diff_databases
 from mudrich.text import Text
 from collections import defaultdict
+from types import MappingProxyType
 from typing import Union, List, Tuple, Dict, Optional
 from uuid import UUID
 
 
 class VolDB(PennDB):
+    ccp_name = "Core Code Parent <CCP>"
+    # What each PennMUSH object type is imported as, unless it has a role below.
+    type_modes = {8: "PLAYER", 1: "ROOM", 4: "EXIT", 2: "THING"}
+
     def __init__(self):
         super().__init__()
         self.ccp = None
+        self.cobjs = dict()
+        self.views = dict()
+        self.cache_generation = -1
+
+    def refresh(self):
+        """
+        Forgets the Core Code Parent, cobj() answers and listing views if the database's
+        inheritance generation has changed since they were worked out. It changes whenever
+        attributes or parents do, and on every setup().
+        """
+        if self.cache_generation != self.inherit_generation:
+            self.ccp = None
+            self.cobjs.clear()
+            self.views.clear()
+            self.cache_generation = self.inherit_generation
 
     def cobj(self, abbr):
+        """
+        Returns the object the Core Code Parent's COBJ`<abbr> attribute points at, or None.
+        """
+        self.refresh()
+        if (key := abbr.upper()) in self.cobjs:
+            return self.cobjs[key]
         if self.ccp is None:
-            if not (
-                code_object := partial_match(
-                    "Core Code Parent <CCP>",
-                    self.objects.values(),
-                    key=lambda x: x.name,
-                )
-            ):
+            if not (code_object := self.find_name(self.ccp_name)):
                 raise Exception("Oops. No Core Code Parent in database!")
             self.ccp = code_object
-        if not (attr := self.ccp.get(f"COBJ`{abbr.upper()}")):
-            return None
-        return self.find_obj(attr.value.plain)
+        found = None
+        if (attr := self.ccp.get(f"COBJ`{key}")):
+            found = self.find_obj(attr.value.plain)
+        self.cobjs[key] = found
+        return found
+
+    def view(self, name: str, build) -> MappingProxyType:
+        """
+        Returns a read-only {dbref: DbObject} of the objects build() returns, in dbref
+        order. It's built once and shared until refresh() drops it.
+        """
+        self.refresh()
+        if (found := self.views.get(name, None)) is None:
+            found = MappingProxyType({o.id: o for o in sorted(build(), key=lambda o: o.id)})
+            self.views[name] = found
+        return found
+
+    def cobj_children(self, abbr):
+        if not (parent := self.cobj(abbr)):
+            return ()
+        return parent.children
 
     def list_accounts(self):
-        if not (account_parent := self.cobj("accounts")):
-            return dict()
-        return {o.id: o for o in account_parent.children}
+        return self.view("accounts", lambda: self.cobj_children("accounts"))
 
     def list_groups(self):
-        if not (group_parent := self.cobj("gop")):
-            return dict()
-        return {o.id: o for o in group_parent.children}
+        return self.view("groups", lambda: self.cobj_children("gop"))
 
     def list_index(self, number: int):
-        return {o.id: o for o in self.type_index.get(number, set())}
+        return self.view(number, lambda: self.type_index.get(number, ()))
 
     def list_players(self):
         return self.list_index(8)
@@ -53,16 +93,256 @@ class VolDB(PennDB):
         return self.list_index(2)
 
     def list_districts(self):
-        return {
-            k: v
-            for k, v in self.list_things().items()
-            if v.get("D`DISTRICT", inherit=False)
+        return self.view(
+            "districts",
+            lambda: (
+                v
+                for v in self.list_things().values()
+                if v.get("D`DISTRICT", inherit=False)
+            ),
+        )
+
+    def import_mode(self, obj) -> Optional[str]:
+        """
+        Returns what obj is imported as, the same way Importer.import_skeleton() decides.
+        """
+        for mode, view in (
+            ("USER", self.list_accounts()),
+            ("FACTION", self.list_groups()),
+            ("DISTRICT", self.list_districts()),
+        ):
+            if obj.id in view:
+                return mode
+        return self.type_modes.get(obj.type, None)
+
+
+class ImportJournal:
+    """
+    An append-only record of an import's progress, kept next to the outdb so that an
+    import which dies partway through can pick up where it left off.
+
+    Every record is a pickled tuple. A record cut short by a crash is dropped on replay.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def replay(self) -> list:
+        records = list()
+        if not self.exists():
+            return records
+        good = 0
+        with open(self.path, "rb") as f:
+            while True:
+                try:
+                    records.append(pickle.load(f))
+                except (EOFError, pickle.UnpicklingError):
+                    break
+                good = f.tell()
+        if good != os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+        return records
+
+    def write(self, *record, sync: bool = False):
+        """
+        Appends a record. It's flushed to the OS at once so it survives the process
+        dying; sync also waits for it to reach the disk.
+        """
+        if self.file is None:
+            self.file = open(self.path, "ab")
+        pickle.dump(record, self.file, protocol=5)
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+
+    def sync(self):
+        if self.file is not None:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        self.close()
+        if self.exists():
+            os.remove(self.path)
+
+
+class ImportLock:
+    """
+    Keeps two imports of the same outdb from running at once, whether in this process
+    or another. It's an exclusive flock() on a file next to the outdb, so the lock goes
+    with the process that held it, however that process ends.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def acquire(self) -> bool:
+        """
+        Returns:
+            False if another import holds the lock.
+        """
+        file = open(self.path, "a")
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            return False
+        self.file = file
+        return True
+
+    def release(self):
+        # The file is left in place: removing it could let a waiting import lock a file
+        # that a third then replaces.
+        if self.file is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+
+class StageProgress:
+    """
+    Counts what one stage of an import has done and reports its throughput and ETA to
+    the importing connection, no more often than every interval seconds. A total of None
+    means it isn't known up front, and only the count and throughput are reported.
+    """
+
+    def __init__(
+        self,
+        connection,
+        stage: str,
+        total: Optional[int],
+        done: int = 0,
+        interval: float = 2.0,
+    ):
+        self.connection = connection
+        self.stage = stage
+        self.total = total
+        self.done = done
+        self.initial = done
+        self.interval = interval
+        self.started = time.monotonic()
+        self.reported = 0.0
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return (self.done - self.initial) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float:
+        rate = self.rate
+        return (self.total - self.done) / rate if rate > 0 else 0.0
+
+    def advance(self, count: int = 1):
+        self.done += count
+        now = time.monotonic()
+        finished = self.total is not None and self.done >= self.total
+        if not finished and now - self.reported < self.interval:
+            return
+        self.reported = now
+        if self.total is None:
+            self.connection.msg(f"{self.stage}: {self.done} ({self.rate:.0f}/sec)")
+        else:
+            self.connection.msg(
+                f"{self.stage}: {self.done}/{self.total} "
+                f"({self.rate:.0f}/sec, ETA {self.eta:.0f}s)"
+            )
+
+
+class ImportBaseline:
+    """
+    What the last complete import of an outdb left in the game: the parsed database it
+    imported, and the game key of every object (by objid) and user (by account dbref).
+    IncrementalImporter diffs the next outdb against it.
+
+    It's two files next to the outdb: <outdb>.baseline, a PennDB snapshot, and
+    <outdb>.imported, a pickle of the keys.
+    """
+
+    def __init__(self, db, objects: dict, users: dict, lost_and_found):
+        self.db = db
+        self.objects = objects
+        self.users = users
+        self.lost_and_found = lost_and_found
+
+    @staticmethod
+    def paths(path: str) -> Tuple[str, str]:
+        return f"{path}.baseline", f"{path}.imported"
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return all(os.path.exists(p) for p in cls.paths(path))
+
+    @classmethod
+    def from_importer(cls, importer):
+        objects = {
+            importer.db.objects[dbid].objid: key for dbid, key in importer.obj_map.items()
         }
+        return cls(importer.db, objects, dict(importer.user_map), importer.lost_and_found)
+
+    def save(self, path: str):
+        snapshot, keys = self.paths(path)
+        self.db.save_snapshot(path, snapshot=snapshot)
+        scratch = f"{keys}.tmp"
+        with open(scratch, "wb") as f:
+            pickle.dump(
+                {
+                    "objects": self.objects,
+                    "users": self.users,
+                    "lost_and_found": self.lost_and_found,
+                },
+                f,
+                protocol=5,
+            )
+        os.replace(scratch, keys)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Returns:
+            ImportBaseline, or None if there isn't a usable one.
+        """
+        snapshot, keys = cls.paths(path)
+        if not cls.exists(path) or not (db := VolDB.read_snapshot(snapshot)):
+            return None
+        with open(keys, "rb") as f:
+            data = pickle.load(f)
+        return cls(db, data["objects"], data["users"], data["lost_and_found"])
 
 
 class Importer:
+    # How many objects go into a single create_objects() call when the game database
+    # supports bulk creation.
+    batch_size = 1000
+    # How many relations go into one bulk write.
+    relation_batch_size = 5000
+    # How many database writes the importer keeps in flight at once.
+    concurrency = 4
+    # Whether a fresh import starts creating objects while the outdb is still being
+    # parsed, and how many parsed batches may wait for the writer before the parser stops.
+    stream = True
+    stream_queue_size = 8
+    # (name, method) for each stage of the import, in order.
+    stages = (
+        ("users", "import_users"),
+        ("skeleton", "import_skeleton"),
+        ("relations", "process_reverse"),
+        ("finalize", "process_finalize"),
+    )
+
     def __init__(self, connection, path):
-        self.db = VolDB.from_outdb(path)
+        self.db: Optional[VolDB] = None
+        self.path = path
         self.connection = connection
         self.game = connection.game
         connection.penn = self
@@ -72,29 +352,280 @@ class Importer:
         self.type_map = defaultdict(dict)
         self.user_map: Dict[int, UUID] = dict()
         self.lost_and_found = None
+        self.relation_batches_done = set()
+        self.applied = set()
+        self.finalized = 0
+        self.fallbacks = set()
+        self.progress: Optional[StageProgress] = None
+        self.journal = ImportJournal(self.journal_path(path))
+        self.lock = ImportLock(self.lock_path(path))
 
-    async def create_obj(self, dbobj, mode):
-        orig_attributes = dict(dbobj.attributes)
-        aliases = orig_attributes.pop('ALIAS', None)
-        attributes = {k: v.value for k, v in orig_attributes.items()}
-        name = Text(dbobj.name)
-        user = self.user_map.get(dbobj.parent, self.lost_and_found)
-        results = await self.game.create_object(type_name=mode, name=name, dbid=dbobj.id, register=False, user=user,
-                                                created=dbobj.created, modified=dbobj.modified, attributes=attributes,
-                                                no_check_name=True)
-        if results.error:
-            raise Exception(f"Could not create GameObject for {dbobj}: {results.error}")
-        key = results.data
+    @staticmethod
+    def journal_path(path: str) -> str:
+        return f"{path}.import"
+
+    @staticmethod
+    def lock_path(path: str) -> str:
+        return f"{path}.lock"
+
+    @classmethod
+    def can_resume(cls, path: str) -> bool:
+        return os.path.exists(cls.journal_path(path))
+
+    async def load(self):
+        """
+        Loads the outdb in a worker thread so the game keeps running meanwhile.
+
+        A fresh import with no up-to-date snapshot streams instead: see import_streaming().
+        Otherwise the journal of any earlier, unfinished import is replayed once the
+        database is loaded.
+        """
+        if self.stream and not self.journal.exists():
+            self.db = await asyncio.to_thread(VolDB.load_snapshot, self.path)
+            if self.db is None:
+                await self.import_streaming()
+                return
+        if self.db is None:
+            self.db = await asyncio.to_thread(VolDB.from_outdb, self.path, cache=True)
+        self.resume()
+
+    def parse_streaming(self, loop, queue, stop):
+        """
+        The producer half of import_streaming(). Runs in a worker thread, parsing the outdb
+        and handing each batch of parsed objects to the event loop through queue. None
+        marks the end, and is sent even if parsing fails or stop is set.
+
+        Returns:
+            the finished VolDB, or None if stopped early.
+        """
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        try:
+            db = VolDB()
+            lines = parse_flatlines(FlatfileReader(self.path))
+            db.read_tables(lines)
+            batch = list()
+            for obj in VolDB.parse_objects(db, lines):
+                if stop.is_set():
+                    return None
+                db.objects[obj.id] = obj
+                batch.append(obj)
+                if len(batch) >= self.batch_size:
+                    put(batch)
+                    batch = list()
+            if batch:
+                put(batch)
+            db.setup()
+        finally:
+            put(None)
+        db.save_snapshot(self.path)
+        return db
+
+    @staticmethod
+    def ccp_target(ccp, abbr: str) -> int:
+        """
+        Returns the dbref the Core Code Parent's own COBJ`<abbr> attribute points at, or -1.
+        """
+        if not (attr := ccp.attributes.get(f"COBJ`{abbr.upper()}", None)):
+            return -1
+        text = attr.value.plain.strip()
+        return int(text[1:]) if text[1:].isdigit() else -1
+
+    def early_mode(self, dbobj, seen: dict, accounts: int, groups: int):
+        """
+        Works out what an object will be imported as from what has been parsed so far.
+
+        Returns None if that depends on something not parsed yet, or if the object will
+        be owned by an imported user, which can't exist until the whole outdb is read.
+        """
+        if dbobj.parent != -1:
+            if not (parent := seen.get(dbobj.parent, None)):
+                return None
+            if parent.parent == accounts:
+                return None
+        if dbobj.parent == accounts:
+            return "USER"
+        if dbobj.parent == groups:
+            return "FACTION"
+        if dbobj.type == 2 and dbobj.get("D`DISTRICT", inherit=False):
+            return "DISTRICT"
+        return VolDB.type_modes.get(dbobj.type, None)
+
+    async def import_streaming(self):
+        """
+        Parses the outdb in a worker thread while creating objects on the event loop.
+
+        As soon as the Core Code Parent has been parsed, every object whose type and owner
+        can already be worked out is created in batches. Objects that depend on imported
+        users, or on anything not parsed yet, are left for the normal stages, which run
+        after this as usual.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.stream_queue_size)
+        stop = threading.Event()
+        producer = loop.run_in_executor(None, self.parse_streaming, loop, queue, stop)
+        try:
+            await self.consume_streaming(queue)
+        except BaseException:
+            # The parser may be waiting on a full queue: let it see stop and finish.
+            stop.set()
+            while await queue.get() is not None:
+                pass
+            raise
+        self.db = await producer
+        self.connection.msg(
+            f"Streaming: created {len(self.obj_map)} objects while parsing."
+        )
+
+    async def consume_streaming(self, queue):
+        st = os.stat(self.path)
+        self.journal.write("outdb", st.st_size, st.st_mtime_ns, sync=True)
+        await self.create_lost_and_found()
+        seen = dict()
+        ccp = None
+        accounts = groups = -1
+        self.progress = StageProgress(self.connection, "Streaming", 0)
 
+        while (batch := await queue.get()) is not None:
+            ready = defaultdict(list)
+            for dbobj in batch:
+                seen[dbobj.id] = dbobj
+                if ccp is None and dbobj.name.lower() == VolDB.ccp_name.lower():
+                    ccp = dbobj
+                    accounts = self.ccp_target(ccp, "accounts")
+                    groups = self.ccp_target(ccp, "gop")
+                if ccp is None or accounts == -1 or groups == -1:
+                    continue
+                if (mode := self.early_mode(dbobj, seen, accounts, groups)):
+                    ready[mode].append(dbobj)
+            self.progress.total = self.progress.done + sum(len(v) for v in ready.values())
+            for mode, objs in ready.items():
+                await self.create_batch(objs, mode)
+
+    def resume(self):
+        """
+        Replays the journal of an earlier, unfinished import of the same outdb.
+        """
+        st = os.stat(self.path)
+        for record in self.journal.replay():
+            kind = record[0]
+            if kind == "outdb":
+                if record[1:] != (st.st_size, st.st_mtime_ns):
+                    raise Exception(
+                        f"{self.journal.path} belongs to a different outdb. "
+                        "Remove it to start over."
+                    )
+            elif kind == "user":
+                self.user_map[record[1]] = record[2]
+            elif kind == "lost_and_found":
+                self.lost_and_found = record[1]
+            elif kind == "objects":
+                _, mode, rows = record
+                for dbid, key in rows:
+                    self.record_obj(self.db.objects[dbid], mode, key)
+            elif kind == "relations":
+                self.relation_batches_done.add(record[1])
+            elif kind == "applied":
+                self.applied.add(record[1])
+            elif kind == "finalized":
+                self.finalized = record[1]
+            elif kind == "stage":
+                self.complete.add(record[1])
+
+        if not self.journal.exists():
+            self.journal.write("outdb", st.st_size, st.st_mtime_ns, sync=True)
+
+    def object_row(self, dbobj, mode) -> dict:
+        """
+        The stored fields of the GameObject made from a DbObject, as create_objects()
+        takes them. create_obj() adds the options only game.create_object() knows.
+        """
+        return dict(
+            type_name=mode,
+            name=Text(dbobj.name),
+            dbid=dbobj.id,
+            user=self.user_map.get(dbobj.parent, self.lost_and_found),
+            created=dbobj.created,
+            modified=dbobj.modified,
+            attributes={
+                k: v.value for k, v in dbobj.attributes.items() if k != "ALIAS"
+            },
+        )
+
+    def record_obj(self, dbobj, mode, key):
         self.obj_map[dbobj.id] = key
         self.old_new[dbobj] = key
         self.type_map[mode][dbobj.dbref] = key
 
+    async def create_obj(self, dbobj, mode):
+        results = await self.game.create_object(
+            **self.object_row(dbobj, mode), register=False, no_check_name=True
+        )
+        if results.error:
+            raise Exception(f"Could not create GameObject for {dbobj}: {results.error}")
+        key = results.data
+        self.record_obj(dbobj, mode, key)
+        self.journal.write("objects", mode, [(dbobj.id, key)])
         return key
 
+    def note_fallback(self, name: str):
+        """
+        Tells the importing connection, once per import, that the game has no bulk call
+        name and rows are being written one call at a time instead.
+        """
+        if name not in self.fallbacks:
+            self.fallbacks.add(name)
+            self.connection.msg(
+                f"The game has no {name}(), so this stage makes one call per row."
+            )
+
+    async def create_batch(self, batch, mode):
+        """
+        Creates a batch of DbObjects of one type.
+
+        The game creates objects one call at a time, and that is what a real import does.
+        create_objects() on the game database is an extension point for one that can do
+        better: nothing in vmush's storage provides it, only the planner's
+        BulkSQLiteStandIn. If it's there, the whole batch is one call to it, which is
+        given object_row()'s rows and must insert them in a single transaction and
+        return their keys, one per row and in order.
+        """
+        if not (bulk := getattr(self.game.db, "create_objects", None)):
+            self.note_fallback("create_objects")
+            for dbobj in batch:
+                await self.create_obj(dbobj, mode)
+            self.journal.sync()
+        else:
+            results = await bulk([self.object_row(dbobj, mode) for dbobj in batch])
+            if results.error:
+                raise Exception(
+                    f"Could not create {mode} batch starting at {batch[0]}: {results.error}"
+                )
+            if len(keys := results.data) != len(batch):
+                raise Exception(
+                    f"create_objects() returned {len(keys)} keys for {len(batch)} "
+                    f"{mode} objects, starting at {batch[0]}."
+                )
+            for dbobj, key in zip(batch, keys):
+                self.record_obj(dbobj, mode, key)
+            self.journal.write(
+                "objects",
+                mode,
+                [(dbobj.id, key) for dbobj, key in zip(batch, keys)],
+                sync=True,
+            )
+        self.progress.advance(len(batch))
+
     async def import_users(self):
         data = self.db.list_accounts()
+        self.progress = StageProgress(
+            self.connection, "Users", len(data), done=len(self.user_map)
+        )
         for dbid, dbobj in data.items():
+            if dbid in self.user_map:
+                continue
             if '@' in dbobj.name:
                 name = f"ImportedAccount_{dbid}"
                 email = dbobj.name
@@ -133,14 +664,22 @@ class Importer:
             if result.error:
                 raise Exception(f"could not import user {dbobj}")
             self.user_map[dbobj.id] = result.data
+            self.journal.write("user", dbobj.id, result.data, sync=True)
+            self.progress.advance()
 
+        await self.create_lost_and_found()
+
+    async def create_lost_and_found(self):
+        if self.lost_and_found is not None:
+            return
         result = await self.game.db.create_user(name=Text("LostAndFound"))
         if result.error:
             raise Exception("could not create LostAndFound")
         self.lost_and_found = result.data
+        self.journal.write("lost_and_found", result.data, sync=True)
 
     async def import_skeleton(self):
-        for data, mode in (
+        bunches = (
             (self.db.list_accounts(), "USER"),
             (self.db.list_groups(), "FACTION"),
             (self.db.list_districts(), "DISTRICT"),
@@ -148,51 +687,390 @@ class Importer:
             (self.db.list_rooms(), "ROOM"),
             (self.db.list_exits(), "EXIT"),
             (self.db.list_things(), "THING"),
-        ):
+        )
+        total = len(set().union(*(data.keys() for data, mode in bunches)))
+        self.progress = StageProgress(
+            self.connection, "Objects", total, done=len(self.obj_map)
+        )
+        for data, mode in bunches:
             await self.import_bunch(data, mode)
 
     async def import_bunch(self, data, mode):
-        for k, v in data.items():
-            if k in self.obj_map:
-                continue
-            await self.create_obj(v, mode)
+        pending = [v for k, v in data.items() if k not in self.obj_map]
+        for i in range(0, len(pending), self.batch_size):
+            await self.create_batch(pending[i : i + self.batch_size], mode)
 
-    async def process_reverse(self):
+    def relations(self):
+        """
+        Yields (key, relation_type, target) for every relation between imported objects.
+        """
         for old, new in self.old_new.items():
+            yield from self.object_relations(old, new)
 
-            if (zone := self.obj_map.get(old.zone, None)) :
-                await self.game.db.set_object_relations(key=new, relation_type='ZONE', target=zone)
+    def object_relations(self, old, new):
+        """
+        Yields the relations of one imported object, old being its DbObject and new its key.
+        """
+        if (zone := self.obj_map.get(old.zone, None)) :
+            yield new, "ZONE", zone
 
-            if (parent := self.obj_map.get(old.parent, None)):
-                await self.game.db.set_object_relations(key=new, relation_type='PARENT', target=parent)
+        if (parent := self.obj_map.get(old.parent, None)):
+            yield new, "PARENT", parent
 
-            if (owner := self.obj_map.get(old.owner, None)):
-                await self.game.db.set_object_relations(key=new, relation_type='OWNER', target=owner)
+        if (owner := self.obj_map.get(old.owner, None)):
+            yield new, "OWNER", owner
 
-            if old.type == 4:  # an exit
-                if (destination := self.obj_map.get(old.location, None)) :
-                    await self.game.db.set_object_relations(key=new, relation_type='DESTINATION', target=destination)
+        if old.type == 4:  # an exit
+            if (destination := self.obj_map.get(old.location, None)) :
+                yield new, "DESTINATION", destination
 
-                if (location := self.obj_map.get(old.exits, None)) :
-                    await self.game.db.set_object_relations(key=new, relation_type='EXITS', target=location)
+            if (location := self.obj_map.get(old.exits, None)) :
+                yield new, "EXITS", location
 
-            else:
-                if (location := self.obj_map.get(old.location, None)) :
-                    await self.game.db.set_object_relations(key=new, relation_type='LOCATION', target=location)
+        else:
+            if (location := self.obj_map.get(old.location, None)) :
+                yield new, "LOCATION", location
+
+    async def gather_bounded(self, func, items, limit: int):
+        """
+        Awaits func(item) for every item, with no more than limit running at once.
+
+        If one fails, the rest are cancelled and waited for before the error is raised, so
+        nothing is still writing to the game or the journal once this returns.
+        """
+        semaphore = asyncio.Semaphore(limit)
+
+        async def run(item):
+            async with semaphore:
+                return await func(item)
+
+        tasks = [asyncio.ensure_future(run(item)) for item in items]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def write_relations(self, numbered_batch):
+        """
+        Writes a batch of relations, given as (batch number, batch).
+
+        The game sets relations one call at a time, and that is what a real import does.
+        Any call that fails stops the batch before it's journaled, so it's written again
+        on resume. As with create_objects(), bulk_set_object_relations() is an extension
+        point only the planner's BulkSQLiteStandIn provides. If the game database has
+        it, the whole batch is one call to it, which must write every row in a single
+        transaction.
+        """
+        number, batch = numbered_batch
+        if (bulk := getattr(self.game.db, "bulk_set_object_relations", None)):
+            results = await bulk(batch)
+            if results.error:
+                raise Exception(f"Could not set relations: {results.error}")
+        else:
+            self.note_fallback("bulk_set_object_relations")
+            for key, relation_type, target in batch:
+                results = await self.game.db.set_object_relations(
+                    key=key, relation_type=relation_type, target=target
+                )
+                if results.error:
+                    raise Exception(
+                        f"Could not set {relation_type} of {key} to {target}: {results.error}"
+                    )
+        self.relation_batches_done.add(number)
+        self.journal.write("relations", number, sync=True)
+        self.progress.advance(len(batch))
+
+    async def process_reverse(self):
+        # Listed in a worker thread: for an IncrementalImporter, relations() walks the diff.
+        relations = await asyncio.to_thread(lambda: list(self.relations()))
+        size = self.relation_batch_size
+        batches = [
+            (i // size, relations[i : i + size])
+            for i in range(0, len(relations), size)
+            if i // size not in self.relation_batches_done
+        ]
+        self.progress = StageProgress(
+            self.connection,
+            "Relations",
+            len(relations),
+            done=len(relations) - sum(len(batch) for number, batch in batches),
+        )
+        await self.gather_bounded(self.write_relations, batches, self.concurrency)
+
+    def finalize_keys(self) -> list:
+        return list(self.old_new.values())
 
     async def process_finalize(self):
-        for old, new in self.old_new.items():
-            await self.game.register_object(new)
+        """
+        Registers every imported object with the game, a batch at a time.
+
+        If the game has register_objects(), each batch is one call to it. Otherwise the
+        batch's objects are registered concurrently, at most Importer.concurrency at once.
+        Control goes back to the event loop between batches so that other connections
+        keep being served during a large import.
+
+        Only the planner's stand-in game has register_objects() so far. Against a real
+        game, objects are registered one call each, concurrently, until it provides one.
+        """
+        keys = self.finalize_keys()
+        bulk = getattr(self.game, "register_objects", None)
+        if not bulk and self.finalized < len(keys):
+            self.note_fallback("register_objects")
+        size = self.batch_size
+        self.progress = StageProgress(
+            self.connection, "Finalize", len(keys), done=self.finalized
+        )
+        for i in range(self.finalized, len(keys), size):
+            batch = keys[i : i + size]
+            if bulk:
+                await bulk(batch)
+            else:
+                await self.gather_bounded(
+                    self.game.register_object, batch, self.concurrency
+                )
+            self.finalized = i + len(batch)
+            self.journal.write("finalized", self.finalized, sync=True)
+            self.progress.advance(len(batch))
+            await asyncio.sleep(0)
+
+    def save_baseline(self):
+        ImportBaseline.from_importer(self).save(self.path)
 
     async def run(self):
+        """
+        Runs the import, holding the outdb's ImportLock throughout. If another import of
+        the same outdb is running, says so and does nothing.
+        """
+        if not self.lock.acquire():
+            self.connection.msg(
+                f"Another import of {self.path} is already running. Wait for it to finish."
+            )
+            return
         try:
-            await self.import_users()
-            await self.import_skeleton()
-            await self.process_reverse()
-            await self.process_finalize()
+            if self.db is None:
+                await self.load()
+                self.connection.msg(
+                    f"Database loaded: {len(self.db.objects)} objects detected!"
+                )
+            for stage, method in self.stages:
+                if stage in self.complete:
+                    self.connection.msg(f"Skipping {stage}: already done.")
+                    continue
+                await getattr(self, method)()
+                self.complete.add(stage)
+                self.journal.write("stage", stage, sync=True)
+            self.save_baseline()
+            self.journal.remove()
             self.connection.msg("IMPORT COMPLETE!?")
         except Exception as e:
             import traceback, sys
 
             traceback.print_exc(file=sys.stdout)
             self.connection.msg(f"SOMETHING WENT WRONG: {e}")
+            self.connection.msg("Run @import again to resume from the last checkpoint.")
+        finally:
+            self.journal.close()
+            self.lock.release()
+
+
+class IncrementalImporter(Importer):
+    """
+    Brings a game that has already imported an outdb up to date with a newer one.
+
+    The new outdb is diffed against the ImportBaseline the last import left behind, and
+    only the differences are written: objects created since are created, deleted ones
+    are deleted, and modified ones get their changed name and attributes rewritten and
+    their relations set again. New accounts get users as usual. Like a full import, it's
+    journaled and resumes from its last checkpoint.
+
+    The diff is never held whole. apply_changes() applies each change as the walk
+    reaches it, and relations() walks it again for the modified objects' relations.
+
+    Beyond what a full import uses, it needs the game database calls in required_calls.
+    A game without them can't be updated, and load() says so before anything is read.
+    """
+
+    stream = False
+    stages = (
+        ("users", "import_users"),
+        ("changes", "apply_changes"),
+        ("relations", "process_reverse"),
+        ("finalize", "process_finalize"),
+    )
+    required_calls = (
+        "update_object",
+        "delete_object",
+        "set_object_attribute",
+        "clear_object_relations",
+    )
+    # relation type -> the DbObject field it comes from, for non-exits and exits.
+    relation_fields = {
+        "ZONE": ("zone", "zone"),
+        "PARENT": ("parent", "parent"),
+        "OWNER": ("owner", "owner"),
+        "LOCATION": ("location", None),
+        "DESTINATION": (None, "location"),
+        "EXITS": (None, "exits"),
+    }
+
+    def __init__(self, connection, path):
+        super().__init__(connection, path)
+        self.baseline: Optional[ImportBaseline] = None
+
+    @classmethod
+    def can_update(cls, path: str) -> bool:
+        return ImportBaseline.exists(path)
+
+    @classmethod
+    def missing_calls(cls, game) -> List[str]:
+        """
+        Returns the names in required_calls that game's database doesn't have.
+        """
+        return [name for name in cls.required_calls if not hasattr(game.db, name)]
+
+    async def load(self):
+        if (missing := self.missing_calls(self.game)):
+            raise Exception(
+                "This game's database can't apply an update to an import. It has no "
+                + ", ".join(f"{name}()" for name in missing)
+                + "."
+            )
+        if not (baseline := await asyncio.to_thread(ImportBaseline.load, self.path)):
+            raise Exception(f"No baseline from an earlier import of {self.path} to update.")
+        self.baseline = baseline
+        self.db = await asyncio.to_thread(VolDB.from_outdb, self.path, cache=True)
+        self.user_map.update(baseline.users)
+        self.lost_and_found = baseline.lost_and_found
+        for dbid, obj in self.db.objects.items():
+            if (key := baseline.objects.get(obj.objid, None)) :
+                self.obj_map[dbid] = key
+        self.resume()
+
+    async def changes(self):
+        """
+        Yields the differences between the baseline and the new outdb, one at a time.
+        The databases are compared in a worker thread, so the game keeps running while
+        long stretches of unchanged objects are walked. Every call walks them afresh,
+        and since neither database changes, always yields the same diffs.
+        """
+        diffs = diff_databases(self.baseline.db, self.db)
+        while (diff := await asyncio.to_thread(next, diffs, None)) is not None:
+            yield diff
+
+    def is_modified(self, diff) -> bool:
+        """
+        Whether diff is a change to an object the last import created.
+        """
+        return diff.kind == "modified" and diff.new.id in self.obj_map
+
+    async def delete_objects(self, keys: list):
+        if (bulk := getattr(self.game.db, "delete_objects", None)):
+            results = await bulk(keys)
+            if results.error:
+                raise Exception(f"Could not delete objects: {results.error}")
+            return
+        for key in keys:
+            results = await self.game.db.delete_object(key=key)
+            if results.error:
+                raise Exception(f"Could not delete {key}: {results.error}")
+
+    async def delete_batch(self, batch: list):
+        await self.delete_objects([self.baseline.objects[diff.objid] for diff in batch])
+        for diff in batch:
+            self.journal.write("applied", diff.objid)
+        self.journal.sync()
+        self.progress.advance(len(batch))
+
+    def lost_relations(self, diff):
+        """
+        Yields the relation types a modified object had and no longer has, because what
+        they point to now wasn't imported.
+        """
+        is_exit = diff.new.type == 4
+        for relation_type, fields in self.relation_fields.items():
+            if not (field := fields[is_exit]) or field not in diff.fields:
+                continue
+            before, after = diff.fields[field]
+            if before in self.obj_map and after not in self.obj_map:
+                yield relation_type
+
+    async def modify_obj(self, diff):
+        key = self.obj_map[diff.new.id]
+        if "name" in diff.fields:
+            results = await self.game.db.update_object(key=key, name=Text(diff.new.name))
+            if results.error:
+                raise Exception(f"Could not rename {diff.new}: {results.error}")
+        for name, (before, after) in diff.attributes.items():
+            if name == "ALIAS":
+                continue
+            results = await self.game.db.set_object_attribute(
+                key, name=name, value=after.value if after else None
+            )
+            if results.error:
+                raise Exception(f"Could not set {name} on {diff.new}: {results.error}")
+        for relation_type in self.lost_relations(diff):
+            results = await self.game.db.clear_object_relations(
+                key=key, relation_type=relation_type
+            )
+            if results.error:
+                raise Exception(
+                    f"Could not clear {relation_type} of {diff.new}: {results.error}"
+                )
+
+    async def apply_changes(self):
+        """
+        Walks the diff once, applying each change as it's reached. Created objects are
+        gathered per type and deleted ones together, each written as soon as
+        batch_size of them are waiting.
+        """
+        created = defaultdict(list)
+        deleted = list()
+        counts = defaultdict(int)
+        self.progress = StageProgress(self.connection, "Changes", None)
+        async for diff in self.changes():
+            counts[diff.kind] += 1
+            if diff.kind == "created":
+                if diff.new.id in self.obj_map or not (mode := self.db.import_mode(diff.new)):
+                    continue
+                created[mode].append(diff.new)
+                if len(created[mode]) >= self.batch_size:
+                    await self.create_batch(created.pop(mode), mode)
+            elif diff.kind == "deleted":
+                if diff.objid not in self.baseline.objects or diff.objid in self.applied:
+                    continue
+                deleted.append(diff)
+                if len(deleted) >= self.batch_size:
+                    await self.delete_batch(deleted)
+                    deleted = list()
+            elif self.is_modified(diff):
+                if diff.objid not in self.applied:
+                    await self.modify_obj(diff)
+                    self.journal.write("applied", diff.objid)
+                self.progress.advance()
+
+        for mode, objs in created.items():
+            await self.create_batch(objs, mode)
+        if deleted:
+            await self.delete_batch(deleted)
+        self.journal.sync()
+        self.connection.msg(
+            f"Changes since the last import: {counts['created']} created, "
+            f"{counts['deleted']} deleted, {counts['modified']} modified."
+        )
+
+    def relations(self):
+        """
+        Yields every relation of the created objects, then those of the modified ones.
+        Relations a modified object lost were cleared by modify_obj().
+        """
+        yield from super().relations()
+        for diff in diff_databases(self.baseline.db, self.db):
+            if self.is_modified(diff):
+                yield from self.object_relations(diff.new, self.obj_map[diff.new.id])
+
+    def finalize_keys(self) -> list:
+        # Only new objects need registering. type_map holds what create_batch() made.
+        return [key for keys in self.type_map.values() for key in keys.values()]
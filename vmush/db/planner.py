@@ -0,0 +1,425 @@
+"""
+Plans an @import without touching the game.
+
+The planner loads an outdb, checks it for the kinds of bad data that make an import go
+wrong, and then runs the real Importer against SQLiteStandIn - a throwaway SQLite
+database that implements the parts of the game database the Importer writes through.
+Everything the import would create is created there instead, so the counts are exact,
+and every write is timed so the wall time of the real import can be estimated.
+
+The import is rehearsed twice. The first rehearsal uses the same calls the game offers
+today, one per object or relation. The second adds the bulk calls the Importer prefers
+when a game has them (create_objects(), bulk_set_object_relations() and
+register_objects()), showing what providing them would save.
+
+Usage:
+    python -m vmush.db.planner outdb [--latency create_object=0.005 ...] [--sqlite path]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+from uuid import uuid4
+
+from .importer import Importer, VolDB
+
+
+class Result:
+    __slots__ = ("data", "error")
+
+    def __init__(self, data=None, error=None):
+        self.data = data
+        self.error = error
+
+
+class SQLiteStandIn:
+    """
+    A stand-in for the game database, backed by SQLite.
+
+    It offers the calls the game does - one object and one relation at a time - and
+    records how many times each write was made, how many rows it carried and how long
+    it took.
+    """
+
+    schema = (
+        "CREATE TABLE users (uuid TEXT PRIMARY KEY, name TEXT UNIQUE COLLATE NOCASE, "
+        "email TEXT, admin_level INTEGER)",
+        "CREATE TABLE objects (key TEXT PRIMARY KEY, type_name TEXT, name TEXT, "
+        "dbid INTEGER, user TEXT, created INTEGER, modified INTEGER, attributes TEXT)",
+        "CREATE TABLE relations (key TEXT, relation_type TEXT, target TEXT)",
+    )
+
+    def __init__(self, path: str = ":memory:"):
+        self.conn = sqlite3.connect(path)
+        for statement in self.schema:
+            self.conn.execute(statement)
+        self.user_names: Dict[str, str] = dict()
+        self.taken = set()
+        # operation -> [calls, rows, seconds]
+        self.timings = defaultdict(lambda: [0, 0, 0.0])
+
+    def close(self):
+        self.conn.close()
+
+    def timed(self, operation: str, rows: int, func, *args):
+        started = time.perf_counter()
+        with self.conn:
+            result = func(*args)
+        timing = self.timings[operation]
+        timing[0] += 1
+        timing[1] += rows
+        timing[2] += time.perf_counter() - started
+        return result
+
+    def _valid_user_name(self, name):
+        """
+        Approximates the game's account name rules: printable, no surrounding
+        whitespace, and not already taken in any case.
+        """
+        name = str(name)
+        if not name or name != name.strip() or not name.isprintable():
+            return False, "invalid characters"
+        if len(name) > 255:
+            return False, "too long"
+        if name.lower() in self.taken:
+            return False, "already in use"
+        return True, None
+
+    def _insert_user(self, key, name, email, admin_level):
+        self.conn.execute(
+            "INSERT INTO users VALUES (?, ?, ?, ?)", (key, name, email, admin_level)
+        )
+
+    async def create_user(self, name, email=None, admin_level=None):
+        name = str(name)
+        key = str(uuid4())
+        try:
+            self.timed("create_user", 1, self._insert_user, key, name, email, admin_level)
+        except sqlite3.IntegrityError as e:
+            return Result(error=str(e))
+        self.user_names[key] = name
+        self.taken.add(name.lower())
+        return Result(key)
+
+    @staticmethod
+    def object_values(key, row) -> tuple:
+        return (
+            key,
+            row["type_name"],
+            str(row["name"]),
+            row["dbid"],
+            str(row["user"]) if row["user"] else None,
+            row["created"],
+            row["modified"],
+            json.dumps({k: v.plain for k, v in row["attributes"].items()}),
+        )
+
+    def _insert_objects(self, values):
+        self.conn.executemany(
+            "INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?)", values
+        )
+
+    async def create_object(self, **row):
+        key = str(uuid4())
+        self.timed("create_object", 1, self._insert_objects, [self.object_values(key, row)])
+        return Result(key)
+
+    def _insert_relations(self, rows):
+        self.conn.executemany("INSERT INTO relations VALUES (?, ?, ?)", rows)
+
+    async def set_object_relations(self, key, relation_type, target):
+        self.timed(
+            "set_object_relations", 1, self._insert_relations, [(key, relation_type, target)]
+        )
+        return Result(True)
+
+
+class BulkSQLiteStandIn(SQLiteStandIn):
+    """
+    A SQLiteStandIn that also has the bulk calls the Importer uses when a game database
+    provides them.
+    """
+
+    async def create_objects(self, rows):
+        keys = [str(uuid4()) for _ in rows]
+        values = [self.object_values(key, row) for key, row in zip(keys, rows)]
+        self.timed("create_objects", len(rows), self._insert_objects, values)
+        return Result(keys)
+
+    async def bulk_set_object_relations(self, rows):
+        self.timed("bulk_set_object_relations", len(rows), self._insert_relations, rows)
+        return Result(True)
+
+
+class PlanGame:
+    """
+    Just enough of a game for an Importer to run against.
+    """
+
+    def __init__(self, db: SQLiteStandIn):
+        self.db = db
+        self.objects = dict()
+
+    async def create_object(self, **row):
+        return await self.db.create_object(**row)
+
+    async def register_object(self, key):
+        self.db.timed("register_object", 1, lambda: None)
+
+
+class BulkPlanGame(PlanGame):
+    async def register_objects(self, keys):
+        self.db.timed("register_objects", len(keys), lambda: None)
+
+
+class PlanConnection:
+    """
+    Collects the messages an Importer sends, and echoes them if verbose.
+    """
+
+    def __init__(self, game: PlanGame, verbose: bool = False):
+        self.game = game
+        self.verbose = verbose
+        self.messages = list()
+        self.penn = None
+
+    def msg(self, text=None, **kwargs):
+        self.messages.append(text)
+        if self.verbose:
+            print(text)
+
+
+class PlanImporter(Importer):
+    """
+    An Importer that keeps its journal and lock in a temporary directory rather than next
+    to the outdb, and saves no baseline, so planning never leaves anything behind for
+    @import or waits on one that's running.
+    """
+
+    stream = False
+
+    def __init__(self, connection, path, workdir: str):
+        self.workdir = workdir
+        super().__init__(connection, path)
+
+    def journal_path(self, path: str) -> str:
+        return os.path.join(self.workdir, f"{os.path.basename(path)}.import")
+
+    def lock_path(self, path: str) -> str:
+        return os.path.join(self.workdir, f"{os.path.basename(path)}.lock")
+
+    def save_baseline(self):
+        pass
+
+
+class ImportPlan:
+    """
+    What an @import of one outdb would do, and how long it would take.
+
+    Latencies given as {operation: seconds per call} replace the ones measured against
+    SQLite when estimating, so figures measured on the production database can be
+    plugged in. Operations are create_user, create_object, set_object_relations and
+    register_object, plus create_objects, bulk_set_object_relations and
+    register_objects for the bulk rehearsal.
+    """
+
+    # Writes the Importer issues with up to Importer.concurrency in flight at once.
+    concurrent = ("set_object_relations", "bulk_set_object_relations", "register_object")
+    # rehearsal -> (description, stand-in class, game class). "game" offers the calls the
+    # game does, and is what the counts in the report come from.
+    rehearsals = {
+        "game": ("the game's calls, one per row", SQLiteStandIn, PlanGame),
+        "bulk": ("bulk calls", BulkSQLiteStandIn, BulkPlanGame),
+    }
+
+    def __init__(self, path: str, latencies: Optional[dict] = None, sqlite: str = ":memory:"):
+        self.path = path
+        self.latencies = dict(latencies or dict())
+        self.sqlite = sqlite
+        self.db: Optional[VolDB] = None
+        self.importers: Dict[str, PlanImporter] = dict()
+        self.standins: Dict[str, SQLiteStandIn] = dict()
+        self.import_times: Dict[str, float] = dict()
+        self.load_time = 0.0
+        self.problems = defaultdict(list)
+        self.attribute_count = 0
+        self.attribute_bytes = 0
+
+    def load(self):
+        started = time.perf_counter()
+        self.db = VolDB.from_outdb(self.path, cache=True)
+        self.load_time = time.perf_counter() - started
+
+    def validate(self):
+        """
+        Looks for references to objects that don't exist in the outdb, and totals up
+        the attributes.
+        """
+        objects = self.db.objects
+        problems = self.problems
+        for dbref, obj in objects.items():
+            if obj.parent != -1 and obj.parent not in objects:
+                problems["orphaned parent"].append(obj)
+            if obj.type == 4:
+                if obj.exits not in objects:
+                    problems["exit with no source"].append(obj)
+                if obj.location >= 0 and obj.location not in objects:
+                    problems["exit to a missing destination"].append(obj)
+            elif obj.type != 1 and obj.location not in objects:
+                problems["orphaned location"].append(obj)
+            if (owner := objects.get(obj.owner, None)) is None:
+                problems["dangling owner"].append(obj)
+            elif owner.type != 8:
+                problems["owner is not a player"].append(obj)
+            for name, attr in obj.attributes.items():
+                self.attribute_count += 1
+                self.attribute_bytes += len(name) + len(attr.value.plain.encode("utf-8"))
+
+    @property
+    def importer(self) -> Optional[PlanImporter]:
+        return self.importers.get("game", None)
+
+    async def rehearse(self, name: str = "game"):
+        """
+        Runs the import against a SQLite stand-in. name picks the calls it offers: see
+        ImportPlan.rehearsals.
+        """
+        description, standin_class, game_class = self.rehearsals[name]
+        sqlite = self.sqlite
+        if name != "game" and sqlite != ":memory:":
+            sqlite = f"{sqlite}.{name}"
+        standin = self.standins[name] = standin_class(sqlite)
+        connection = PlanConnection(game_class(standin))
+        with tempfile.TemporaryDirectory() as workdir:
+            importer = self.importers[name] = PlanImporter(connection, self.path, workdir)
+            importer.db = self.db
+            started = time.perf_counter()
+            await importer.run()
+            self.import_times[name] = time.perf_counter() - started
+        if connection.messages[-1] != "IMPORT COMPLETE!?":
+            raise Exception(f"{name} rehearsal failed: {connection.messages[-2]}")
+        if name != "game":
+            return
+
+        for dbid, key in importer.user_map.items():
+            account = self.db.objects[dbid]
+            if "@" not in account.name and standin.user_names[key] != account.name:
+                self.problems["account renamed"].append(account)
+
+    def run(self):
+        self.load()
+        self.validate()
+        for name in self.rehearsals:
+            asyncio.run(self.rehearse(name))
+            self.standins[name].close()
+        return self
+
+    def latency(self, operation: str, name: str = "game") -> float:
+        if operation in self.latencies:
+            return self.latencies[operation]
+        calls, rows, seconds = self.standins[name].timings[operation]
+        return seconds / calls if calls else 0.0
+
+    def estimate(self, name: str = "game") -> Dict[str, float]:
+        """
+        Returns {operation: estimated seconds} for the real import, making the calls the
+        named rehearsal did.
+        """
+        out = dict()
+        for operation, (calls, rows, seconds) in self.standins[name].timings.items():
+            total = calls * self.latency(operation, name)
+            if operation in self.concurrent:
+                total /= max(1, self.importers[name].concurrency)
+            out[operation] = total
+        return out
+
+    def report(self) -> str:
+        db = self.db
+        lines = [f"Import plan for {self.path}", ""]
+        lines.append(f"Objects in outdb: {len(db.objects)} (loaded in {self.load_time:.1f}s)")
+        for number, name in ((8, "PLAYER"), (1, "ROOM"), (4, "EXIT"), (2, "THING")):
+            lines.append(f"  type {name}: {len(db.list_index(number))}")
+
+        lines.append("")
+        lines.append(f"Would create {len(self.importer.user_map) + 1} users (including LostAndFound)")
+        lines.append(f"Would create {len(self.importer.obj_map)} objects:")
+        for mode, created in self.importer.type_map.items():
+            lines.append(f"  {mode}: {len(created)}")
+        lost = sum(
+            1 for obj in self.importer.old_new if obj.parent not in self.importer.user_map
+        )
+        lines.append(f"  owned by LostAndFound: {lost}")
+        lines.append(
+            f"Attributes: {self.attribute_count} "
+            f"({self.attribute_bytes / 1024 / 1024:.1f} MB of text)"
+        )
+
+        lines.append("")
+        if not self.problems:
+            lines.append("No problems found.")
+        for problem, found in sorted(self.problems.items()):
+            sample = ", ".join(f"#{obj.id}" for obj in found[:10])
+            more = f" and {len(found) - 10} more" if len(found) > 10 else ""
+            lines.append(f"{problem}: {len(found)} ({sample}{more})")
+
+        for name, (description, standin_class, game_class) in self.rehearsals.items():
+            if name not in self.standins:
+                continue
+            lines.append("")
+            lines.append(
+                f"Rehearsal using {description}: took {self.import_times[name]:.1f}s against SQLite."
+            )
+            lines.append("Estimated write time:")
+            estimate = self.estimate(name)
+            for operation, (calls, rows, seconds) in sorted(
+                self.standins[name].timings.items()
+            ):
+                source = "given" if operation in self.latencies else "measured"
+                lines.append(
+                    f"  {operation}: {calls} calls, {rows} rows, "
+                    f"{self.latency(operation, name) * 1000:.2f}ms/call ({source}) "
+                    f"-> {estimate[operation]:.1f}s"
+                )
+            lines.append(
+                f"  total: {sum(estimate.values()) + self.load_time:.1f}s including the load"
+            )
+        return "\n".join(lines)
+
+
+def parse_latency(text: str):
+    operation, _, seconds = text.partition("=")
+    try:
+        return operation, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected operation=seconds, got {text!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan an @import without touching the game.")
+    parser.add_argument("path", help="the PennMUSH outdb to plan an import of")
+    parser.add_argument(
+        "--latency",
+        type=parse_latency,
+        action="append",
+        default=list(),
+        help="seconds per call for an operation on the production database, "
+        "e.g. create_object=0.005. May be given more than once.",
+    )
+    parser.add_argument(
+        "--sqlite", default=":memory:", help="keep the rehearsal's SQLite database here"
+    )
+    args = parser.parse_args()
+
+    plan = ImportPlan(args.path, latencies=dict(args.latency), sqlite=args.sqlite)
+    print(plan.run().report())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
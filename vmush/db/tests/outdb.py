@@ -0,0 +1,89 @@
+"""
+Small PennMUSH outdbs for the tests, laid out the way VolDB expects: a Core Code Parent
+whose COBJ`ACCOUNTS and COBJ`GOP point at the account and group parents.
+"""
+import random
+
+
+def game_objects(accounts: int = 5, rooms: int = 10, things: int = 20, seed: int = 0) -> dict:
+    """
+    Returns {dbref: fields} for a small game. Tests change a copy and write it out with
+    write_outdb().
+    """
+    rng = random.Random(seed)
+    objects = dict()
+
+    def add(name, type_, **fields):
+        dbref = len(objects)
+        obj = dict(
+            name=name,
+            type=type_,
+            location=-1,
+            exits=-1,
+            parent=-1,
+            owner=1,
+            zone=-1,
+            flags="",
+            attributes=[],
+            created=1000 + dbref,
+            modified=2000 + dbref,
+        )
+        obj.update(fields)
+        objects[dbref] = obj
+        return dbref
+
+    add("Room Zero", 1)
+    add("God", 8, location=0, flags="WIZARD")
+    add(
+        "Core Code Parent <CCP>",
+        2,
+        location=0,
+        attributes=[("COBJ`ACCOUNTS", "#3"), ("COBJ`GOP", "#4")],
+    )
+    add("Account Parent", 2, location=2)
+    add("Group Parent", 2, location=2)
+    room_ids = [add(f"Room {i}", 1) for i in range(rooms)]
+    account_ids = list()
+    for i in range(accounts):
+        name = f"user{i}" if i % 2 else f"user{i}@example.com"
+        account = add(name, 2, location=2, parent=3, attributes=[("EMAIL", f"u{i}@x.com")])
+        account_ids.append(account)
+        add(f"Char{i}", 8, location=rng.choice(room_ids), parent=account, owner=len(objects))
+    for i in range(2):
+        add(f"Group {i}", 2, location=2, parent=4)
+    add("District 0", 2, location=2, attributes=[("D`DISTRICT", "1")])
+    for i in range(rooms):
+        add(f"Exit {i}", 4, location=rng.choice(room_ids), exits=rng.choice(room_ids))
+    for i in range(things):
+        add(
+            f"Thing {i}",
+            2,
+            location=rng.choice(room_ids),
+            parent=rng.choice([-1, 2]),
+            owner=rng.choice(account_ids) + 1,
+            attributes=[("DESC", f"thing {i}")],
+        )
+    return objects
+
+
+def write_outdb(path: str, objects: dict):
+    with open(path, "w", encoding="latin_1", newline="") as f:
+        w = f.write
+        w('+V-1\ndbversion 5\nsavedtime "x"\n')
+        w('+FLAGS LIST\nflagcount 1\n name "WIZARD"\n  letter "W"\nflagaliascount 0\n')
+        w("+POWER LIST\nflagcount 0\nflagaliascount 0\n")
+        w("+ATTRIBUTES LIST\nattrcount 0\nattraliascount 0\n")
+        w(f"~{max(objects) + 1}\n")
+        for dbref in sorted(objects):
+            obj = objects[dbref]
+            w(f"!{dbref}\n")
+            w(f'name "{obj["name"]}"\n')
+            w(f"location #{obj['location']}\ncontents #-1\nexits #{obj['exits']}\n")
+            w(f"next #-1\nparent #{obj['parent']}\nlockcount 0\nowner #{obj['owner']}\n")
+            w(f"zone #{obj['zone']}\npennies 0\ntype {obj['type']}\n")
+            w(f'flags "{obj["flags"]}"\npowers ""\nwarnings ""\n')
+            w(f"created {obj['created']}\nmodified {obj['modified']}\n")
+            w(f"attrcount {len(obj['attributes'])}\n")
+            for name, value in obj["attributes"]:
+                w(f' name "{name}"\n  owner #1\n  flags ""\n  derefs 0\n  value "{value}"\n')
+        w("***END OF DUMP***\n")
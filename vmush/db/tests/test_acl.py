@@ -0,0 +1,344 @@
+import itertools
+import unittest
+
+from django.db import transaction
+
+from vmush.tests import setup_django
+
+setup_django()
+
+from vmush.db.acl import ACLEntry, ACLHandler, PermissionSchema
+
+
+class Identity:
+    """
+    An identity that represents itself and its members.
+    """
+
+    pks = itertools.count(1)
+
+    def __init__(self, name: str, members=()):
+        self.pk = next(self.pks)
+        self.name = name
+        self.members = set(members)
+
+    def __repr__(self):
+        return f"<Identity {self.name}>"
+
+    def represents(self, accessor, mode) -> bool:
+        return accessor is self or accessor in self.members
+
+    def get_identity(self):
+        return self
+
+
+class QuerySet(list):
+    def __init__(self, store, rows):
+        super().__init__(rows)
+        self.store = store
+        store.queries += 1
+
+    def select_related(self, *fields):
+        self.store.related.update(fields)
+        return self
+
+    def select_for_update(self):
+        self.store.locks.append(("rows", transaction.get_connection().in_atomic_block))
+        return self
+
+    def delete(self):
+        pks = {row.pk for row in self}
+        self.store.rows = [row for row in self.store.rows if row.pk not in pks]
+
+
+class Store:
+    """
+    The ACL table: every row, and a count of the queries made against it.
+    """
+
+    def __init__(self):
+        self.rows = list()
+        self.pks = itertools.count(1)
+        self.queries = 0
+        self.related = set()
+        # (what, whether it was inside a transaction) for every select_for_update().
+        self.locks = list()
+
+    def query(self, match) -> QuerySet:
+        return QuerySet(self, [row for row in self.rows if match(row)])
+
+
+class RowManager:
+    def __init__(self, store: Store):
+        self.store = store
+
+    def bulk_create(self, rows):
+        self.store.queries += 1
+        for row in rows:
+            row.pk = next(self.store.pks)
+            self.store.rows.append(row)
+
+    def bulk_update(self, rows, fields):
+        self.store.queries += 1
+
+    def filter(self, obj__in):
+        objs = {id(obj) for obj in obj__in}
+        return self.store.query(lambda row: id(row.obj) in objs)
+
+
+def row_model(store: Store):
+    class Row:
+        objects = RowManager(store)
+
+        def __init__(self, identity, mode, allow_permissions, deny_permissions, obj):
+            self.pk = None
+            self.identity = identity
+            self.identity_id = identity.pk
+            self.mode = mode
+            self.allow_permissions = allow_permissions
+            self.deny_permissions = deny_permissions
+            self.obj = obj
+            self.obj_id = obj.pk
+
+    return Row
+
+
+class Field:
+    name = "obj"
+
+
+class EntryManager:
+    """
+    obj.acl_entries: the reverse relation from an object to its ACL rows.
+    """
+
+    field = Field()
+
+    def __init__(self, obj, store: Store, model):
+        self.obj = obj
+        self.store = store
+        self.model = model
+
+    def all(self) -> QuerySet:
+        return self.store.query(lambda row: row.obj is self.obj)
+
+    def filter(self, identity__in=None, pk__in=None) -> QuerySet:
+        if pk__in is not None:
+            return self.store.query(lambda row: row.pk in pk__in)
+        pks = {identity.pk for identity in identity__in}
+        return self.store.query(lambda row: row.obj is self.obj and row.identity_id in pks)
+
+
+class Attributes:
+    def __init__(self):
+        self._acl_init = False
+
+
+class Meta:
+    label = "tests.Board"
+
+
+class BoardManager:
+    def __init__(self, store: Store):
+        self.store = store
+
+    def select_for_update(self):
+        self.store.locks.append(("object", transaction.get_connection().in_atomic_block))
+        return self
+
+    def filter(self, pk):
+        return self
+
+    def values_list(self, *fields, flat=False):
+        self.store.queries += 1
+        return list()
+
+
+def board_model(store: Store, model):
+    class Board:
+        _meta = Meta()
+        objects = BoardManager(store)
+
+        def __init__(self, pk: int):
+            self.pk = pk
+            self.db = Attributes()
+            self.acl_entries = EntryManager(self, store, model)
+
+    return Board
+
+
+class ACLTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = Store()
+        self.model = row_model(self.store)
+        self.board = board_model(self.store, self.model)
+        self.owner = Identity("owner")
+        self.alice = Identity("alice")
+        self.faction = Identity("faction", [self.alice])
+        identities = {
+            ("s", "owner"): self.owner,
+            ("a", "alice"): self.alice,
+            ("f", "faction"): self.faction,
+        }
+
+        class Handler(ACLHandler):
+            permissions_custom = {"read": 2, "write": 4}
+            permissions_implicit = {"read": ["write"]}
+
+            @staticmethod
+            def find_identities(names, enactor=None):
+                return {
+                    key: identities[key]
+                    for prefix, name in names
+                    if (key := (prefix.lower(), name.lower())) in identities
+                }
+
+        self.handler_class = Handler
+        ACLHandler.compiled.clear()
+
+    def apply(self, obj, text: str):
+        handler = self.handler_class(obj)
+        return handler.apply_acl(handler.parse_acl(text))
+
+
+class TestInitialization(ACLTestCase):
+    def test_rows_before_first_check(self):
+        # An ACL set before the object's first check doesn't stop permissions_init.
+        board = self.board(1)
+        self.apply(board, "+A:Alice/read")
+        self.assertTrue(self.handler_class(board).check_access(self.owner, "write"))
+        self.assertTrue(board.db._acl_init)
+
+    def test_many_rows_before_first_check(self):
+        boards = [self.board(pk) for pk in (1, 2, 3)]
+        self.apply(boards[0], "+A:Alice/read")
+        boards[1].db._acl_init = True
+        self.assertEqual(
+            self.handler_class.check_access_many(self.owner, "write", boards),
+            [True, False, True],
+        )
+        self.assertTrue(all(board.db._acl_init for board in boards))
+
+    def test_many_one_read(self):
+        boards = [self.board(pk) for pk in (1, 2, 3)]
+        for board in boards:
+            self.apply(board, "+F:Faction/read")
+            board.db._acl_init = True
+        ACLHandler.compiled.clear()
+        queries = self.store.queries
+        self.assertEqual(
+            self.handler_class.check_access_many(self.alice, "read", boards),
+            [True, True, True],
+        )
+        self.assertEqual(self.store.queries - queries, 1)
+
+
+class TestApply(ACLTestCase):
+    def test_locked_read(self):
+        board = self.board(1)
+        self.apply(board, "+A:Alice/read,+F:Faction/write")
+        self.store.locks.clear()
+        self.apply(board, "-A:Alice/read,+!F:Faction/write")
+        # the object and its rows are locked before they're read, inside the transaction
+        # that writes them.
+        self.assertEqual(self.store.locks, [("object", True), ("rows", True)])
+        handler = self.handler_class(board)
+        self.assertFalse(handler.check_access(self.alice, "read"))
+        self.assertFalse(handler.check_access(self.alice, "write"))
+
+    def test_summary(self):
+        board = self.board(1)
+        self.assertEqual(
+            self.apply(board, "+A:Alice/read,+F:Faction/write"),
+            {"created": 2, "updated": 0, "deleted": 0},
+        )
+        self.assertEqual(
+            self.apply(board, "-A:Alice/read,+F:Faction/read"),
+            {"created": 0, "updated": 1, "deleted": 1},
+        )
+
+
+class TestCompiledCache(ACLTestCase):
+    def test_identities_fetched_with_rows(self):
+        board = self.board(1)
+        self.apply(board, "+A:Alice/read")
+        self.store.related.clear()
+        self.assertTrue(self.handler_class(board).check_access(self.alice, "read"))
+        self.assertIn("identity", self.store.related)
+
+    def test_cached_until_applied(self):
+        board = self.board(1)
+        self.apply(board, "+A:Alice/read")
+        handler = self.handler_class(board)
+        self.assertTrue(handler.check_access(self.alice, "read"))
+        queries = self.store.queries
+        self.assertTrue(handler.check_access(self.alice, "read"))
+        self.assertEqual(self.store.queries, queries)
+        self.apply(board, "-A:Alice/read")
+        self.assertFalse(handler.check_access(self.alice, "read"))
+
+    def test_membership_not_cached(self):
+        board = self.board(1)
+        self.apply(board, "+F:Faction/read")
+        handler = self.handler_class(board)
+        self.assertTrue(handler.check_access(self.alice, "read"))
+        self.faction.members.clear()
+        self.assertFalse(handler.check_access(self.alice, "read"))
+
+    def test_bounded(self):
+        self.handler_class.compiled_cache_size = 2
+        for pk in (1, 2, 3):
+            self.handler_class(self.board(pk)).check_access(self.alice, "read")
+        self.assertEqual(
+            list(ACLHandler.compiled), [("tests.Board", 2), ("tests.Board", 3)]
+        )
+
+    def test_keyed_by_model(self):
+        board = self.board(1)
+        self.apply(board, "+A:Alice/read")
+        other = board_model(self.store, self.model)
+        other._meta = type("Meta", (), {"label": "tests.Other"})()
+        self.assertTrue(self.handler_class(board).check_access(self.alice, "read"))
+        self.assertFalse(self.handler_class(other(1)).check_access(self.alice, "read"))
+
+
+class TestPermissionSchema(unittest.TestCase):
+    def setUp(self):
+        self.schema = PermissionSchema(
+            {"full": 1},
+            {"read": 2, "write": 4, "post": 8, "moderate": 16},
+            # moderate implies post implies read; read and write imply each other.
+            {"read": ["write", "post"], "write": ["read"], "post": ["moderate"]},
+        )
+
+    def test_grants(self):
+        self.assertEqual(dict(self.schema.bits)["moderate"], 16)
+        self.assertEqual(self.schema.grants["full"], 1)
+        self.assertEqual(self.schema.grants["moderate"], 1 | 16)
+        self.assertEqual(self.schema.grants["post"], 1 | 8 | 16)
+        self.assertEqual(self.schema.grants["read"], 1 | 2 | 4 | 8 | 16)
+        self.assertEqual(self.schema.grants["write"], 1 | 2 | 4 | 8 | 16)
+
+    def test_mask(self):
+        self.assertEqual(self.schema.mask("read/Write"), 6)
+        self.assertEqual(self.schema.mask(["post", "full"]), 9)
+        self.assertEqual(self.schema.mask(""), 0)
+        with self.assertRaises(ValueError):
+            self.schema.mask("read/delete")
+
+    def test_read_only(self):
+        with self.assertRaises(TypeError):
+            self.schema.bits["delete"] = 32
+        with self.assertRaises(TypeError):
+            self.schema.grants["read"] = 0
+
+    def test_compiled_per_subclass(self):
+        class Custom(ACLHandler):
+            permissions_custom = {"read": 2}
+
+        self.assertIsNot(Custom.schema, ACLHandler.schema)
+        self.assertEqual(set(ACLHandler.schema.bits), {"full"})
+        self.assertEqual(Custom(None).perm_dict(), {"full": 1, "read": 2})
+        self.assertEqual(Custom(None).perm_bit("read"), 3)
+        with self.assertRaises(ValueError):
+            Custom(None).schema.mask("write")
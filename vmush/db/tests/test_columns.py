@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+
+from vmush.db.columns import ObjectColumns, RelationView
+from vmush.db.flatfile import PennDB
+
+from .outdb import game_objects, write_outdb
+
+
+class ColumnsDB(PennDB):
+    index_engine = "columns"
+
+
+class TestColumnsEngine(unittest.TestCase):
+    relations = ("contents", "children", "owns", "zoned")
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        objects = game_objects()
+        # A gap, so the columns have a dbref with no object behind it.
+        del objects[7]
+        path = os.path.join(self.dir.name, "game.outdb")
+        write_outdb(path, objects)
+        self.sets = PennDB.from_outdb(path)
+        self.columns = ColumnsDB.from_outdb(path)
+
+    def related(self, db: PennDB) -> dict:
+        return {
+            (obj.id, relation): sorted(o.id for o in getattr(obj, relation))
+            for obj in db.objects.values()
+            for relation in self.relations
+        }
+
+    def test_matches_sets(self):
+        self.assertIsNone(self.sets.columns)
+        self.assertIsInstance(self.columns.objects[2].contents, RelationView)
+        self.assertEqual(self.related(self.columns), self.related(self.sets))
+        for obj in self.columns.objects.values():
+            other = self.sets.objects[obj.id]
+            for field in ("location_obj", "parent_obj", "owner_obj", "zone_obj", "exits_obj"):
+                found, expected = getattr(obj, field), getattr(other, field)
+                self.assertEqual(found and found.id, expected and expected.id)
+
+    def test_views(self):
+        parent = self.columns.objects[2]
+        contents = parent.contents
+        self.assertEqual(len(contents), len(self.sets.objects[2].contents))
+        self.assertTrue(contents)
+        self.assertIn(self.columns.objects[3], contents)
+        self.assertNotIn(self.columns.objects[0], contents)
+        self.assertEqual([obj.id for obj in contents], sorted(obj.id for obj in contents))
+
+    def test_set_parent(self):
+        child = self.columns.objects[3]
+        new = self.columns.objects[4]
+        self.assertNotIn(child, new.children)
+        child.set_parent(new)
+        self.assertIn(child, new.children)
+        self.assertEqual(child.parent, 4)
+        self.sets.objects[3].set_parent(self.sets.objects[4])
+        self.assertEqual(self.related(self.columns), self.related(self.sets))
+        child.set_parent(None)
+        self.assertNotIn(child, new.children)
+        self.assertIsNone(child.parent_obj)
+
+
+class TestObjectColumns(unittest.TestCase):
+    class Obj:
+        def __init__(self, location: int):
+            self.location = location
+            self.exits = self.parent = self.owner = self.zone = -1
+            self.type = 2
+
+    def test_gaps(self):
+        # #4 is missing, so the objects in it belong nowhere.
+        objects = {0: self.Obj(-1), 1: self.Obj(0), 2: self.Obj(4), 3: self.Obj(0), 5: self.Obj(3)}
+        columns = ObjectColumns(objects)
+        self.assertEqual(columns.size, 6)
+        self.assertFalse(columns.exists(4))
+        self.assertEqual(columns.get("location", 2), -1)
+        self.assertEqual(list(columns.related("contents", 0)), [1, 3])
+        self.assertEqual(list(columns.related("contents", 3)), [5])
+        self.assertEqual(list(columns.related("contents", 4)), [])
+        columns.set("location", 5, 0)
+        self.assertEqual(list(columns.related("contents", 0)), [1, 3, 5])
+        self.assertEqual(list(columns.related("contents", 3)), [])
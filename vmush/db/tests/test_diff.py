@@ -0,0 +1,82 @@
+import copy
+import os
+import tempfile
+import unittest
+
+from vmush.db.diff import diff_databases, summarize
+from vmush.db.flatfile import PennDB
+
+from .outdb import game_objects, write_outdb
+
+
+class TestDiffDatabases(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.old = game_objects()
+        self.new = copy.deepcopy(self.old)
+        self.opened = list()
+
+    def tearDown(self):
+        for db in self.opened:
+            db.close()
+        self.dir.cleanup()
+
+    def load(self, name: str, objects: dict, indexed: bool = False) -> PennDB:
+        path = os.path.join(self.dir.name, name)
+        write_outdb(path, objects)
+        if indexed:
+            db = PennDB.open_indexed(path)
+            self.opened.append(db)
+            return db
+        return PennDB.from_outdb(path)
+
+    def diffs(self, indexed: bool = False) -> dict:
+        old = self.load("old", self.old, indexed)
+        new = self.load("new", self.new, indexed)
+        return {(d.kind, d.objid): d for d in diff_databases(old, new)}
+
+    def test_identical(self):
+        self.assertEqual(self.diffs(), dict())
+
+    def test_changes(self):
+        last = max(self.new)
+        self.new[last]["name"] = "Renamed"
+        self.new[last]["attributes"] = [("DESC", "changed"), ("NEW", "attribute")]
+        self.new[last - 1]["location"] = 0
+        del self.new[last - 2]
+        self.new[last + 1] = dict(self.new[last], name="Brand New", created=9999)
+
+        diffs = self.diffs()
+        self.assertEqual(
+            set(diffs),
+            {
+                ("modified", f"#{last}:{1000 + last}"),
+                ("modified", f"#{last - 1}:{999 + last}"),
+                ("deleted", f"#{last - 2}:{998 + last}"),
+                ("created", f"#{last + 1}:9999"),
+            },
+        )
+        renamed = diffs[("modified", f"#{last}:{1000 + last}")]
+        self.assertEqual(renamed.fields["name"], (self.old[last]["name"], "Renamed"))
+        self.assertEqual(set(renamed.attributes), {"DESC", "NEW"})
+        self.assertIsNone(renamed.attributes["NEW"][0])
+        moved = diffs[("modified", f"#{last - 1}:{999 + last}")]
+        self.assertEqual(set(moved.fields), {"location"})
+        self.assertEqual(
+            summarize(diffs.values()),
+            {"created": 1, "deleted": 1, "modified": 2, "attributes": 2, "locks": 0},
+        )
+
+    def test_recycled_dbref(self):
+        last = max(self.new)
+        self.new[last]["created"] = 5000
+        self.assertEqual(
+            set(self.diffs()),
+            {("deleted", f"#{last}:{1000 + last}"), ("created", f"#{last}:5000")},
+        )
+
+    def test_indexed_matches_parsed(self):
+        last = max(self.new)
+        self.new[last]["name"] = "Renamed"
+        del self.new[last - 1]
+        self.assertEqual(set(self.diffs()), set(self.diffs(indexed=True)))
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+from vmush.db.export import export_columns, load_columns, npy_header
+from vmush.db.flatfile import PennDB
+
+from .outdb import game_objects, write_outdb
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        path = os.path.join(self.dir.name, "game.outdb")
+        objects = game_objects()
+        objects[1]["attributes"] = [("NOTE", "café")]
+        write_outdb(path, objects)
+        self.db = PennDB.from_outdb(path)
+        self.out = os.path.join(self.dir.name, "columns")
+        self.manifest = export_columns(self.db, self.out)
+
+    def test_header(self):
+        for length in (0, 1, 10**9):
+            header = npy_header("<i4", length)
+            self.assertEqual(len(header) % 64, 0)
+            self.assertTrue(header.endswith(b"\n"))
+
+    def test_manifest(self):
+        tables = self.manifest["tables"]
+        self.assertEqual(tables["objects"]["rows"], len(self.db.objects))
+        self.assertEqual(
+            tables["attributes"]["rows"],
+            sum(len(obj.attributes) for obj in self.db.objects.values()),
+        )
+        self.assertEqual(tables["flags"]["rows"], 1)
+        self.assertEqual(tables["objects"]["columns"]["name"], "string")
+
+    @unittest.skipIf(numpy is None, "needs numpy")
+    def test_round_trip(self):
+        objects = load_columns(self.out, "objects")
+        dbrefs = sorted(self.db.objects)
+        self.assertEqual(objects["dbref"].tolist(), dbrefs)
+        self.assertEqual(objects["name"], [self.db.objects[i].name for i in dbrefs])
+        for field in ("type", "location", "parent", "owner", "created"):
+            self.assertEqual(
+                objects[field].tolist(), [getattr(self.db.objects[i], field) for i in dbrefs]
+            )
+
+        attributes = load_columns(self.out, "attributes")
+        rows = set(zip(attributes["dbref"].tolist(), attributes["name"], attributes["value"]))
+        expected = {
+            (obj.id, name, attr.value.plain)
+            for obj in self.db.objects.values()
+            for name, attr in obj.attributes.items()
+        }
+        self.assertEqual(rows, expected)
+        self.assertIn((1, "NOTE", "café"), rows)
+
+        flags = load_columns(self.out, "flags")
+        self.assertEqual(flags["dbref"].tolist(), [1])
+        self.assertEqual(flags["flag"].tolist(), ["WIZARD"])
@@ -0,0 +1,252 @@
+import os
+import random
+import tempfile
+import unittest
+
+from vmush.db.flatfile import (
+    DbObject,
+    FlatfileReader,
+    ObjAttribute,
+    ObjectIndex,
+    PennDB,
+    compile_attr_pattern,
+    parse_flatfile,
+)
+
+from .outdb import game_objects, write_outdb
+
+
+class TestTokenizer(unittest.TestCase):
+    """
+    FlatfileReader must produce exactly the lines parse_flatfile does, whatever the block
+    size.
+    """
+
+    block_sizes = (1, 2, 3, 7, 64, 1 << 20)
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".outdb")
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def assertSameLines(self, data: bytes):
+        with open(self.path, "wb") as f:
+            f.write(data)
+        expected = list(parse_flatfile(self.path))
+        for block_size in self.block_sizes:
+            self.assertEqual(
+                list(FlatfileReader(self.path, block_size=block_size)),
+                expected,
+                f"block size {block_size} on {data!r}",
+            )
+
+    def test_tricky_lines(self):
+        self.assertSameLines(
+            b'name "plain"\n'
+            b'value "quote \\" inside"\n'
+            b'value "backslash \\\\ inside"\n'
+            b'value "literal\nnewline"\n'
+            b"crlf #1\r\n"
+            b"lone cr #2\r"
+            b'value "cr\r\ninside"\n'
+            b'value "escaped \\\r\ncr"\n'
+            b"no final newline"
+        )
+
+    def test_random(self):
+        rng = random.Random(0)
+        alphabet = ("a", "b", " ", '"', "\\", "\r", "\n", "\r\n", 'x"y', "!12\n")
+        for _ in range(500):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 60)))
+            self.assertSameLines(text.encode("latin_1"))
+
+
+class TestLattr(unittest.TestCase):
+    def setUp(self):
+        self.obj = DbObject(None, 1)
+        for name in ("FOO", "FO", "ABC", "AC", "AB", "CD", "COBJ`X", "XY", "Y"):
+            self.obj.attributes[name] = name
+
+    def test_quantified_prefix(self):
+        self.assertEqual(set(self.obj.lattr("FOO?")), {"FOO", "FO"})
+        self.assertEqual(set(self.obj.lattr("AB?C")), {"ABC", "AC"})
+        self.assertEqual(set(self.obj.lattr("X{0,1}Y")), {"XY", "Y"})
+
+    def test_alternation(self):
+        self.assertEqual(set(self.obj.lattr("AB|CD")), {"AB", "ABC", "CD"})
+
+    def test_wildcard(self):
+        self.assertEqual(set(self.obj.lattr("COBJ`*")), {"COBJ`X"})
+        # * stands for at least one character, so the one before it stays in the prefix.
+        self.assertEqual(compile_attr_pattern("COBJ`*")[1], "COBJ`")
+        self.assertEqual(compile_attr_pattern("AB*C")[1], "AB")
+
+
+class OutdbTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.objects = game_objects()
+
+    def write(self, name: str = "game.outdb") -> str:
+        path = os.path.join(self.dir.name, name)
+        write_outdb(path, self.objects)
+        return path
+
+    def named(self, db: PennDB, name: str) -> DbObject:
+        return next(obj for obj in db.objects.values() if obj.name == name)
+
+
+class TestInheritance(OutdbTestCase):
+    def setUp(self):
+        super().setUp()
+        # Account Parent, which every account inherits from.
+        self.objects[3]["attributes"] = [("GREETING", "hello"), ("EMAIL", "parent@x.com")]
+        self.db = PennDB.from_outdb(self.write())
+        self.char = self.named(self.db, "Char0")
+        self.account = self.char.parent_obj
+        self.parent = self.account.parent_obj
+
+    def value(self, obj: DbObject, name: str, **kwargs):
+        found = obj.get(name, **kwargs)
+        return found.value if found else None
+
+    def test_get(self):
+        self.assertEqual(self.value(self.char, "greeting"), "hello")
+        self.assertEqual(self.value(self.char, "EMAIL"), "u0@x.com")
+        self.assertIsNone(self.value(self.char, "GREETING", inherit=False))
+        self.assertEqual(self.char.get("MISSING", "default"), "default")
+
+    def test_matches_walk(self):
+        names = {name for obj in self.db.objects.values() for name in obj.attributes}
+        names.add("MISSING")
+        flattened = {
+            (obj.id, name): self.value(obj, name)
+            for obj in self.db.objects.values()
+            for name in names
+        }
+        self.db.flatten_inheritance = False
+        walked = {
+            (obj.id, name): self.value(obj, name)
+            for obj in self.db.objects.values()
+            for name in names
+        }
+        self.assertEqual(flattened, walked)
+
+    def test_invalidate_attributes(self):
+        self.assertEqual(self.value(self.char, "GREETING"), "hello")
+        changed = ObjAttribute("GREETING")
+        changed.value = "goodbye"
+        self.parent.attributes["GREETING"] = changed
+        self.parent.invalidate_attributes()
+        self.assertEqual(self.value(self.char, "GREETING"), "goodbye")
+
+    def test_set_parent(self):
+        self.assertEqual(self.value(self.char, "GREETING"), "hello")
+        self.account.set_parent(None)
+        self.assertIsNone(self.value(self.char, "GREETING"))
+        self.assertNotIn(self.account, self.parent.children)
+        self.account.set_parent(self.parent)
+        self.assertEqual(self.value(self.char, "GREETING"), "hello")
+        self.assertIn(self.account, self.parent.children)
+
+    def test_parent_loop(self):
+        self.parent.set_parent(self.char)
+        self.assertEqual(self.char.ancestors(), [self.account, self.parent])
+        self.assertEqual(self.value(self.char, "GREETING"), "hello")
+        self.assertEqual(self.value(self.parent, "EMAIL"), "parent@x.com")
+        self.assertIsNone(self.value(self.account, "MISSING"))
+        self.assertEqual(self.value(self.account, "GREETING"), "hello")
+
+
+class TestFindName(OutdbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db = PennDB.from_outdb(self.write())
+
+    def test_exact(self):
+        self.assertEqual(self.db.find_name("ROOM ZERO").id, 0)
+        self.assertEqual(self.db.find_name("room zero", exact=True).id, 0)
+        self.assertIsNone(self.db.find_name("room", exact=True))
+        self.assertIsNone(self.db.find_name("nothing"))
+
+    def test_prefix(self):
+        # The shortest name wins, then the lowest dbref, as with partial_match().
+        self.assertEqual(self.db.find_name("room").name, "Room 0")
+        self.assertEqual(self.db.find_name("GR").name, "Group 0")
+        self.assertEqual(self.db.find_name("group p").name, "Group Parent")
+        self.assertEqual(self.db.find_name("Core").id, 2)
+
+    def test_rename(self):
+        room = self.named(self.db, "Room 0")
+        room.name = "Attic"
+        self.db.index_names()
+        self.assertIs(self.db.find_name("att"), room)
+        self.assertEqual(self.db.find_name("room").name, "Room 1")
+
+
+class TestOpenIndexed(OutdbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = self.write()
+        self.parsed = PennDB.from_outdb(self.path)
+
+    def open(self) -> PennDB:
+        db = PennDB.open_indexed(self.path)
+        self.addCleanup(db.close)
+        return db
+
+    def test_matches_parsed(self):
+        db = self.open()
+        self.assertEqual(db.objects, dict())
+        for dbref, expected in self.parsed.objects.items():
+            obj = db.find_obj(dbref)
+            self.assertEqual(
+                (obj.objid, obj.name, obj.location, obj.owner, sorted(obj.attributes)),
+                (
+                    expected.objid,
+                    expected.name,
+                    expected.location,
+                    expected.owner,
+                    sorted(expected.attributes),
+                ),
+            )
+            self.assertEqual(
+                [o.id for o in obj.ancestors()], [o.id for o in expected.ancestors()]
+            )
+            self.assertIs(db.find_obj(expected.dbref), obj)
+            self.assertIs(db.find_obj(expected.objid), obj)
+        self.assertIsNone(db.find_obj(len(self.objects) + 10))
+        self.assertIsNone(db.find_obj("#3:1"))
+
+    def test_inherits(self):
+        db = self.open()
+        char = db.find_obj(self.named(self.parsed, "Char0").id)
+        self.assertEqual(char.get("EMAIL").value.plain, "u0@x.com")
+
+    def test_index_reused(self):
+        self.open()
+        self.assertTrue(os.path.exists(ObjectIndex.index_path(self.path)))
+        self.assertIsNotNone(ObjectIndex.load(self.path))
+
+    def test_index_rebuilt(self):
+        self.open()
+        stat = os.stat(self.path)
+        # The same length, written to a new file and renamed over the old one, with the
+        # old mtime put back: only the inode tells them apart.
+        self.objects[5]["name"] = "Room X"
+        scratch = self.write("scratch.outdb")
+        os.utime(scratch, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(scratch, self.path)
+        self.assertEqual(os.stat(self.path).st_size, stat.st_size)
+        self.assertIsNone(ObjectIndex.load(self.path))
+        self.assertEqual(self.open().find_obj(5).name, "Room X")
+
+    def test_close(self):
+        with PennDB.open_indexed(self.path) as db:
+            outdb = db.outdb
+            self.assertEqual(db.find_obj(0).name, "Room Zero")
+        self.assertIsNone(db.outdb)
+        self.assertTrue(outdb.closed)
@@ -0,0 +1,353 @@
+import asyncio
+import copy
+import itertools
+import os
+import pickle
+import tempfile
+import unittest
+
+from vmush.db.importer import (
+    ImportBaseline,
+    ImportJournal,
+    ImportLock,
+    Importer,
+    IncrementalImporter,
+)
+
+from .outdb import game_objects, write_outdb
+
+
+class Result:
+    def __init__(self, data=None, error=None):
+        self.data = data
+        self.error = error
+
+
+class FakeDB:
+    """
+    The game database calls the Importer makes, one row at a time like the real game.
+    fail_relation makes that set_object_relations() call, counting from 1, return an
+    error, as the game does when a write fails.
+    """
+
+    def __init__(self, fail_relation: int = 0):
+        self.keys = itertools.count()
+        self.users = dict()
+        self.objects = dict()
+        self.relations = list()
+        self.relation_calls = 0
+        self.fail_relation = fail_relation
+        self.renamed = list()
+        self.cleared = list()
+
+    def _valid_user_name(self, name):
+        return True, None
+
+    async def create_user(self, name, email=None, admin_level=None):
+        key = f"u{next(self.keys)}"
+        self.users[key] = str(name)
+        return Result(key)
+
+    async def set_object_relations(self, key, relation_type, target):
+        self.relation_calls += 1
+        if self.relation_calls == self.fail_relation:
+            return Result(error="relation write failed")
+        self.relations.append((key, relation_type, target))
+        return Result(True)
+
+    async def delete_object(self, key):
+        self.objects.pop(key, None)
+        return Result(True)
+
+    async def update_object(self, key, name):
+        self.renamed.append(key)
+        return Result(True)
+
+    async def set_object_attribute(self, key, name, value):
+        return Result(True)
+
+    async def clear_object_relations(self, key, relation_type):
+        self.cleared.append((key, relation_type))
+        return Result(True)
+
+
+class UnclearableFakeDB(FakeDB):
+    """
+    A FakeDB with no clear_object_relations(), which IncrementalImporter needs.
+    """
+
+    @property
+    def clear_object_relations(self):
+        raise AttributeError("clear_object_relations")
+
+
+class BulkFakeDB(FakeDB):
+    async def create_objects(self, rows):
+        keys = list()
+        for row in rows:
+            keys.append(key := f"o{next(self.keys)}")
+            self.objects[key] = row
+        return Result(keys)
+
+    async def bulk_set_object_relations(self, rows):
+        self.relation_calls += 1
+        if self.relation_calls == self.fail_relation:
+            return Result(error="relation write failed")
+        self.relations.extend(rows)
+        return Result(True)
+
+
+class ShortBulkFakeDB(BulkFakeDB):
+    """
+    A BulkFakeDB whose create_objects() loses the last row of every batch.
+    """
+
+    async def create_objects(self, rows):
+        results = await super().create_objects(rows)
+        return Result(results.data[:-1])
+
+
+class FakeGame:
+    def __init__(self, db: FakeDB):
+        self.db = db
+        self.objects = dict()
+        self.registered = list()
+
+    async def create_object(self, **row):
+        key = f"o{next(self.db.keys)}"
+        self.db.objects[key] = row
+        return Result(key)
+
+    async def register_object(self, key):
+        self.registered.append(key)
+
+
+class FakeConnection:
+    def __init__(self, game: FakeGame):
+        self.game = game
+        self.messages = list()
+        self.penn = None
+
+    def msg(self, text=None, **kwargs):
+        self.messages.append(text)
+
+
+class TestImportJournal(unittest.TestCase):
+    def test_replay_drops_partial_record(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "outdb.import")
+            journal = ImportJournal(path)
+            journal.write("outdb", 1, 2)
+            journal.write("user", 5, "u0", sync=True)
+            journal.close()
+            good = os.path.getsize(path)
+            with open(path, "ab") as f:
+                f.write(pickle.dumps(("stage", "users"), protocol=5)[:-3])
+
+            self.assertEqual(journal.replay(), [("outdb", 1, 2), ("user", 5, "u0")])
+            self.assertEqual(os.path.getsize(path), good)
+            journal.remove()
+            self.assertFalse(journal.exists())
+
+
+class ImportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.objects = game_objects()
+        self.new_outdb()
+
+    def new_outdb(self):
+        """
+        Writes the outdb to a new temporary directory, removed after the test, and points
+        self.path at it. Nothing an earlier import left next to the old one is seen.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "outdb")
+        write_outdb(self.path, self.objects)
+
+    def run_import(self, importer_class, game: FakeGame, **options) -> FakeConnection:
+        connection = FakeConnection(game)
+        importer = importer_class(connection, self.path)
+        for name, value in options.items():
+            setattr(importer, name, value)
+        asyncio.run(importer.run())
+        return connection
+
+    @staticmethod
+    def relations_by_dbid(game: FakeGame, keys=None) -> list:
+        """
+        The relations written, as (dbid, relation type, target dbid), so that different
+        games can be compared. Setting a relation is idempotent, and a failed batch is
+        written again in full on resume, so repeats are ignored.
+        """
+        dbids = {key: row["dbid"] for key, row in game.db.objects.items()}
+        return sorted(
+            {
+                (dbids[key], relation_type, dbids.get(target, None))
+                for key, relation_type, target in game.db.relations
+                if keys is None or key in keys
+            }
+        )
+
+
+class TestImporter(ImportTestCase):
+    def test_import(self):
+        game = FakeGame(FakeDB())
+        connection = self.run_import(Importer, game, stream=False)
+        self.assertEqual(connection.messages[-1], "IMPORT COMPLETE!?")
+        self.assertFalse(Importer.can_resume(self.path))
+        self.assertTrue(ImportBaseline.exists(self.path))
+        dbids = sorted(row["dbid"] for row in game.db.objects.values())
+        self.assertEqual(dbids, sorted(self.objects))
+        self.assertEqual(sorted(game.registered), sorted(game.db.objects))
+
+    def test_lock(self):
+        game = FakeGame(FakeDB())
+        running = ImportLock(Importer.lock_path(self.path))
+        self.assertTrue(running.acquire())
+        try:
+            connection = self.run_import(Importer, game, stream=False)
+        finally:
+            running.release()
+        self.assertIn("already running", connection.messages[-1])
+        self.assertFalse(game.db.objects)
+        self.assertFalse(Importer.can_resume(self.path))
+
+        connection = self.run_import(Importer, game, stream=False)
+        self.assertEqual(connection.messages[-1], "IMPORT COMPLETE!?")
+
+    def test_create_objects(self):
+        game = FakeGame(BulkFakeDB())
+        connection = self.run_import(Importer, game, stream=False)
+        self.assertEqual(connection.messages[-1], "IMPORT COMPLETE!?")
+        for row in game.db.objects.values():
+            self.assertNotIn("register", row)
+            self.assertNotIn("no_check_name", row)
+
+    def test_create_objects_key_count(self):
+        game = FakeGame(ShortBulkFakeDB())
+        connection = self.run_import(Importer, game, stream=False)
+        self.assertIn("returned", connection.messages[-2])
+        importer = Importer(FakeConnection(game), self.path)
+        self.assertFalse([r for r in importer.journal.replay() if r[0] == "objects"])
+
+    def test_resume_after_failure(self):
+        for db_class in (FakeDB, BulkFakeDB):
+            with self.subTest(db=db_class.__name__):
+                for suffix in (".import", ".baseline", ".imported", ".snapshot"):
+                    if os.path.exists(self.path + suffix):
+                        os.remove(self.path + suffix)
+                expected = FakeGame(db_class())
+                self.run_import(Importer, expected, stream=False, relation_batch_size=7)
+                for suffix in (".baseline", ".imported"):
+                    os.remove(self.path + suffix)
+
+                game = FakeGame(db_class(fail_relation=3))
+                connection = self.run_import(
+                    Importer, game, stream=False, relation_batch_size=7, concurrency=1
+                )
+                self.assertTrue(connection.messages[-2].startswith("SOMETHING WENT WRONG"))
+                self.assertTrue(Importer.can_resume(self.path))
+
+                connection = self.run_import(
+                    Importer, game, stream=False, relation_batch_size=7, concurrency=1
+                )
+                self.assertEqual(connection.messages[-1], "IMPORT COMPLETE!?")
+                # nothing was created twice, and every relation was written.
+                self.assertEqual(len(game.db.objects), len(expected.db.objects))
+                self.assertEqual(self.relations_by_dbid(game), self.relations_by_dbid(expected))
+                for suffix in (".baseline", ".imported"):
+                    os.remove(self.path + suffix)
+
+    def test_streaming_matches(self):
+        created = dict()
+        for stream in (False, True):
+            # the non-streaming run leaves a snapshot, which would stop the next streaming.
+            if os.path.exists(self.path + ".snapshot"):
+                os.remove(self.path + ".snapshot")
+            game = FakeGame(BulkFakeDB())
+            connection = self.run_import(Importer, game, stream=stream)
+            self.assertEqual(connection.messages[-1], "IMPORT COMPLETE!?")
+            created[stream] = (
+                sorted(row["dbid"] for row in game.db.objects.values()),
+                self.relations_by_dbid(game),
+            )
+            for suffix in (".baseline", ".imported"):
+                os.remove(self.path + suffix)
+        self.assertEqual(created[True], created[False])
+
+
+class TestIncrementalImporter(ImportTestCase):
+    def update(self, game: FakeGame):
+        """
+        Imports the outdb into game, then writes the next night's: two objects renamed
+        and one created.
+        """
+        self.run_import(Importer, game, stream=False)
+        newer = copy.deepcopy(self.objects)
+        last = max(newer)
+        for dbref in (last, last - 1):
+            newer[dbref]["name"] = f"Renamed {dbref}"
+        newer[last + 1] = dict(newer[last], name="Brand New", created=9999)
+        write_outdb(self.path, newer)
+        os.utime(self.path, ns=(0, os.stat(self.path).st_mtime_ns + 1))
+        return {
+            key for key, row in game.db.objects.items() if row["dbid"] in (last, last - 1)
+        }
+
+    def test_update(self):
+        game = FakeGame(FakeDB())
+        renamed = self.update(game)
+        self.assertTrue(IncrementalImporter.can_update(self.path))
+        connection = self.run_import(IncrementalImporter, game)
+        self.assertEqual(connection.messages[-1], "IMPORT COMPLETE!?")
+        self.assertEqual(set(game.db.renamed), renamed)
+        self.assertIn("Brand New", {str(row["name"]) for row in game.db.objects.values()})
+
+    def test_missing_calls(self):
+        game = FakeGame(UnclearableFakeDB())
+        self.update(game)
+        before = dict(game.db.objects)
+        connection = self.run_import(IncrementalImporter, game)
+        self.assertIn("clear_object_relations()", connection.messages[-2])
+        self.assertEqual(game.db.objects, before)
+        self.assertFalse(game.db.renamed)
+        self.assertFalse(Importer.can_resume(self.path))
+
+    def test_lost_relation_cleared(self):
+        game = FakeGame(FakeDB())
+        self.run_import(Importer, game, stream=False)
+        newer = copy.deepcopy(self.objects)
+        thing = max(d for d, fields in newer.items() if fields["type"] == 2)
+        newer[thing]["location"] = -1
+        write_outdb(self.path, newer)
+        os.utime(self.path, ns=(0, os.stat(self.path).st_mtime_ns + 1))
+        key = next(k for k, row in game.db.objects.items() if row["dbid"] == thing)
+
+        connection = self.run_import(IncrementalImporter, game)
+        self.assertEqual(connection.messages[-1], "IMPORT COMPLETE!?")
+        self.assertEqual(game.db.cleared, [(key, "LOCATION")])
+
+    def test_resume_keeps_modified_relations(self):
+        expected = FakeGame(FakeDB())
+        renamed = self.update(expected)
+        expected.db.relations.clear()
+        self.run_import(IncrementalImporter, expected, relation_batch_size=2)
+        want = self.relations_by_dbid(expected, renamed)
+        self.assertTrue(want)
+
+        self.new_outdb()
+        game = FakeGame(FakeDB())
+        renamed = self.update(game)
+        game.db.relations.clear()
+        game.db.relation_calls = 0
+        game.db.fail_relation = 3
+        connection = self.run_import(
+            IncrementalImporter, game, relation_batch_size=2, concurrency=1
+        )
+        self.assertTrue(connection.messages[-2].startswith("SOMETHING WENT WRONG"))
+        connection = self.run_import(
+            IncrementalImporter, game, relation_batch_size=2, concurrency=1
+        )
+        self.assertEqual(connection.messages[-1], "IMPORT COMPLETE!?")
+        self.assertEqual(self.relations_by_dbid(game, renamed), want)
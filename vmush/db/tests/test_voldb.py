@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+
+from vmush.db.importer import VolDB
+
+from .outdb import game_objects, write_outdb
+
+
+class VolDBTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        path = os.path.join(self.dir.name, "game.outdb")
+        write_outdb(path, game_objects())
+        self.db = VolDB.from_outdb(path)
+        self.ccp = self.db.objects[2]
+
+
+class TestCobj(VolDBTestCase):
+    def test_lookup(self):
+        self.assertEqual(self.db.cobj("accounts").id, 3)
+        self.assertEqual(self.db.cobj("GOP").id, 4)
+        self.assertIsNone(self.db.cobj("missing"))
+        self.assertIs(self.db.ccp, self.ccp)
+
+    def test_memoized(self):
+        self.db.cobj("accounts")
+        self.db.cobj("missing")
+        self.assertEqual(set(self.db.cobjs), {"ACCOUNTS", "MISSING"})
+        # Answers come from the cache, without reading the attribute again.
+        del self.ccp.attributes["COBJ`ACCOUNTS"]
+        self.assertEqual(self.db.cobj("accounts").id, 3)
+
+    def test_refreshed(self):
+        self.assertEqual(self.db.cobj("accounts").id, 3)
+        self.ccp.attributes["COBJ`ACCOUNTS"] = self.ccp.attributes.pop("COBJ`GOP")
+        self.ccp.invalidate_attributes()
+        self.assertEqual(self.db.cobj("accounts").id, 4)
+        self.assertIsNone(self.db.cobj("gop"))
+
+
+class TestViews(VolDBTestCase):
+    def test_listings(self):
+        accounts = self.db.list_accounts()
+        self.assertEqual(list(accounts), sorted(accounts))
+        self.assertEqual(len(accounts), 5)
+        self.assertTrue(all(obj.parent == 3 for obj in accounts.values()))
+        self.assertEqual(list(self.db.list_groups()), sorted(o.id for o in self.db.objects[4].children))
+        self.assertEqual(
+            [obj.name for obj in self.db.list_districts().values()], ["District 0"]
+        )
+        self.assertEqual(list(self.db.list_rooms()), sorted(self.db.list_rooms()))
+        self.assertEqual(set(self.db.list_rooms().values()), self.db.type_index[1])
+
+    def test_read_only(self):
+        with self.assertRaises(TypeError):
+            self.db.list_things()[0] = self.ccp
+
+    def test_cached(self):
+        self.assertIs(self.db.list_accounts(), self.db.list_accounts())
+        self.assertIs(self.db.list_exits(), self.db.list_exits())
+
+    def test_refreshed(self):
+        accounts = self.db.list_accounts()
+        account = next(iter(accounts.values()))
+        account.set_parent(None)
+        self.assertIsNot(self.db.list_accounts(), accounts)
+        self.assertNotIn(account.id, self.db.list_accounts())
+        self.assertEqual(self.db.import_mode(account), "THING")
+
+    def test_import_mode(self):
+        modes = {
+            self.db.import_mode(obj)
+            for obj in self.db.objects.values()
+            if obj.name in ("user1", "Group 0", "District 0", "Room 0", "Exit 0", "Char0")
+        }
+        self.assertEqual(modes, {"USER", "FACTION", "DISTRICT", "ROOM", "EXIT", "PLAYER"})
@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from vmush.models import GameObject, GameObjectSave
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrites every object's save history as keyframes and deltas. With --keep-days, "
+        "versions older than that are folded into one keyframe per object."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep-days",
+            type=int,
+            default=None,
+            help="keep every version from the last this many days, and only the newest "
+            "one before that",
+        )
+
+    def handle(self, *args, **options):
+        before = None
+        if (days := options["keep_days"]) is not None:
+            before = timezone.now() - timedelta(days=days)
+        rows = [0, 0]
+        size = [0, 0]
+        for obj in GameObject.objects.all().iterator():
+            result = GameObjectSave.compact(obj, before=before)
+            for total, counts in ((rows, result["rows"]), (size, result["bytes"])):
+                total[0] += counts[0]
+                total[1] += counts[1]
+        self.stdout.write(
+            f"Saves: {rows[0]} -> {rows[1]}. "
+            f"Data: {size[0] / 1024:.1f} KB -> {size[1] / 1024:.1f} KB."
+        )
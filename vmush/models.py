@@ -1,4 +1,45 @@
-from django.db import models
+import json
+
+from django.db import models, transaction
+from django.utils import timezone
+
+
+def json_delta(old: dict, new: dict) -> dict:
+    """
+    Returns what turns old into new: {"set": {key: value}, "unset": [key], "patch":
+    {key: delta}}, leaving out the parts that are empty. Keys whose values are dicts on
+    both sides are patched recursively. Anything else that changed is set whole.
+    """
+    delta = dict()
+    set_, patch = dict(), dict()
+    for key, value in new.items():
+        if key not in old:
+            set_[key] = value
+        elif (before := old[key]) != value:
+            if isinstance(before, dict) and isinstance(value, dict):
+                patch[key] = json_delta(before, value)
+            else:
+                set_[key] = value
+    if set_:
+        delta["set"] = set_
+    if unset := [key for key in old if key not in new]:
+        delta["unset"] = unset
+    if patch:
+        delta["patch"] = patch
+    return delta
+
+
+def apply_delta(data: dict, delta: dict) -> dict:
+    """
+    Applies a json_delta() to data in place, and returns it.
+    """
+    for key, value in delta.get("set", {}).items():
+        data[key] = value
+    for key in delta.get("unset", ()):
+        data.pop(key, None)
+    for key, sub in delta.get("patch", {}).items():
+        apply_delta(data[key], sub)
+    return data
 
 
 class TypeName(models.Model):
@@ -20,13 +61,152 @@ class GameObject(models.Model):
 
 
 class GameObjectSave(models.Model):
+    """
+    One saved version of a GameObject.
+
+    A save is either a keyframe, whose data is the whole object, or a delta, whose data
+    is a json_delta() from the save before it. chain is 0 for a keyframe and counts the
+    deltas since the last one otherwise, so any version can be rebuilt from its
+    keyframe and at most keyframe_interval deltas, fetched in one query.
+
+    New saves are given the whole object, however they're made - record(), or
+    objects.create() and save() from code that predates deltas - and save() decides
+    how to store it. Each must be newer than the object's newest save.
+    """
+
     obj = models.ForeignKey(GameObject, related_name="saves", on_delete=models.CASCADE)
     version = models.DateTimeField(null=False)
     data = models.JSONField(null=False)
+    chain = models.PositiveSmallIntegerField(default=0)
+
+    # The most deltas that may follow a keyframe.
+    keyframe_interval = 32
 
     class Meta:
         unique_together = (("obj", "version"),)
 
+    @property
+    def is_keyframe(self) -> bool:
+        return self.chain == 0
+
+    def resolve(self) -> dict:
+        """
+        Returns the whole object as it was at this version.
+        """
+        if self.is_keyframe:
+            return json.loads(json.dumps(self.data))
+        saves = list(
+            GameObjectSave.objects.filter(obj_id=self.obj_id, version__lte=self.version)
+            .order_by("-version")
+            .only("data", "chain")[: self.chain + 1]
+        )
+        data = json.loads(json.dumps(saves[-1].data))
+        for save in reversed(saves[:-1]):
+            apply_delta(data, save.data)
+        return data
+
+    def save(self, *args, **kwargs):
+        """
+        Saving a new row stores its data - the whole object - as a delta from the
+        object's newest save, unless that save ends a full chain or the delta wouldn't
+        be smaller. It then becomes obj.latest. Afterwards data is what was stored: use
+        resolve() for the whole object.
+
+        Rows that already exist are saved as they are.
+
+        Raises:
+            ValueError: if the new row's version isn't newer than the newest save.
+                resolve() rebuilds a version from the saves at or before it, so an older
+                one would be rebuilt from the wrong rows.
+        """
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        if self.version is None:
+            self.version = timezone.now()
+        with transaction.atomic():
+            # Locked so two saves of one object can't both build on the same latest.
+            list(
+                GameObject.objects.select_for_update()
+                .filter(pk=self.obj_id)
+                .values_list("pk", flat=True)
+            )
+            latest = (
+                GameObjectSave.objects.filter(obj_id=self.obj_id)
+                .order_by("-version")
+                .first()
+            )
+            if latest is not None:
+                if self.version <= latest.version:
+                    raise ValueError(
+                        f"Can't save version {self.version} of object {self.obj_id}: "
+                        f"it already has version {latest.version}."
+                    )
+                if latest.chain < self.keyframe_interval:
+                    delta = json_delta(latest.resolve(), self.data)
+                    if len(json.dumps(delta)) < len(json.dumps(self.data)):
+                        self.chain = latest.chain + 1
+                        self.data = delta
+            super().save(*args, **kwargs)
+            self.obj.latest = self
+            self.obj.save(update_fields=["latest"])
+
+    @classmethod
+    def record(cls, obj: GameObject, data: dict, version=None):
+        """
+        Saves data as obj's newest version, at version or now. See save().
+        """
+        save = cls(obj=obj, version=version or timezone.now(), data=data)
+        save.save()
+        return save
+
+    @classmethod
+    def compact(cls, obj: GameObject, before=None) -> dict:
+        """
+        Rewrites obj's history as keyframes and deltas, turning old full saves into
+        deltas where that's smaller. If before is given, every version older than it is
+        folded into the newest of them, which becomes a keyframe.
+
+        Returns:
+            {"rows": (before, after), "bytes": (before, after)}
+        """
+        saves = list(cls.objects.filter(obj=obj).order_by("version"))
+        if not saves:
+            return {"rows": (0, 0), "bytes": (0, 0)}
+        old_bytes = sum(len(json.dumps(save.data)) for save in saves)
+
+        versions = list()
+        data = dict()
+        for save in saves:
+            data = json.loads(json.dumps(save.data)) if save.is_keyframe else apply_delta(
+                json.loads(json.dumps(data)), save.data
+            )
+            versions.append((save, data))
+        dropped = list()
+        if before is not None:
+            old = [v for v in versions if v[0].version < before]
+            dropped = [save.pk for save, data in old[:-1]]
+            versions = versions[len(old) - 1 :] if old else versions
+
+        previous = None
+        chain = 0
+        for save, data in versions:
+            save.chain, save.data = 0, data
+            if previous is not None and chain < cls.keyframe_interval:
+                delta = json_delta(previous, data)
+                if len(json.dumps(delta)) < len(json.dumps(data)):
+                    chain += 1
+                    save.chain, save.data = chain, delta
+            if save.chain == 0:
+                chain = 0
+            previous = data
+
+        with transaction.atomic():
+            if dropped:
+                cls.objects.filter(pk__in=dropped).delete()
+            cls.objects.bulk_update([save for save, data in versions], ["data", "chain"])
+        new_bytes = sum(len(json.dumps(save.data)) for save, data in versions)
+        return {"rows": (len(saves), len(versions)), "bytes": (old_bytes, new_bytes)}
+
 
 class HostAddress(models.Model):
     ip_address = models.GenericIPAddressField(unique=True)
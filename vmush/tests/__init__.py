@@ -0,0 +1,24 @@
+"""
+setup_django() configures Django for the tests that need it: vmush as the only app, on
+an in-memory SQLite database that has vmush's tables.
+"""
+import django
+from django.conf import settings
+
+
+def setup_django():
+    if settings.configured:
+        return
+    settings.configure(
+        DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}},
+        INSTALLED_APPS=["vmush"],
+        USE_TZ=True,
+    )
+    django.setup()
+
+    from django.apps import apps
+    from django.db import connection
+
+    with connection.schema_editor() as editor:
+        for model in apps.get_app_config("vmush").get_models():
+            editor.create_model(model)
@@ -0,0 +1,160 @@
+import copy
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from django.db import transaction
+
+from vmush.tests import setup_django
+
+setup_django()
+
+from vmush.models import GameObject, GameObjectSave, TypeName, apply_delta, json_delta
+
+
+class TestDelta(unittest.TestCase):
+    def assertRoundTrip(self, old: dict, new: dict):
+        delta = json_delta(old, new)
+        self.assertEqual(apply_delta(copy.deepcopy(old), delta), new)
+
+    def test_parts(self):
+        old = {"name": "Box", "gone": 1, "attributes": {"A": "1", "B": "2"}}
+        new = {"name": "Crate", "added": [1], "attributes": {"A": "1", "C": "3"}}
+        self.assertEqual(
+            json_delta(old, new),
+            {
+                "set": {"name": "Crate", "added": [1]},
+                "unset": ["gone"],
+                "patch": {"attributes": {"set": {"C": "3"}, "unset": ["B"]}},
+            },
+        )
+        self.assertRoundTrip(old, new)
+
+    def test_unchanged(self):
+        self.assertEqual(json_delta({"a": {"b": 1}}, {"a": {"b": 1}}), {})
+
+    def test_type_change(self):
+        self.assertRoundTrip({"a": {"b": 1}}, {"a": [1]})
+        self.assertRoundTrip({"a": 1}, {"a": {"b": 1}})
+
+    def test_random(self):
+        rng = random.Random(0)
+
+        def obj(depth: int = 0) -> dict:
+            keys = [rng.choice("abcde") for _ in range(rng.randint(0, 4))]
+            return {key: value(depth + 1) for key in keys}
+
+        def value(depth: int):
+            if depth < 3 and rng.random() < 0.3:
+                return obj(depth)
+            return rng.choice([0, 1, "x", None, [1, 2], True])
+
+        for _ in range(300):
+            self.assertRoundTrip(obj(), obj())
+
+
+class SaveTestCase(unittest.TestCase):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    def setUp(self):
+        self.transaction = transaction.atomic()
+        self.transaction.__enter__()
+        type_name, created = TypeName._default_manager.get_or_create(name="THING")
+        self.obj = GameObject.objects.create(
+            type_name=type_name, dbid=1, created=1, name="Box"
+        )
+
+    def tearDown(self):
+        transaction.set_rollback(True)
+        self.transaction.__exit__(None, None, None)
+
+    def version(self, i: int):
+        return self.start + timedelta(minutes=i)
+
+    @staticmethod
+    def data(i: int) -> dict:
+        attributes = {f"ATTR{n}": "x" * 40 for n in range(20)}
+        attributes["COUNTER"] = str(i)
+        return {"name": f"Box {i}", "attributes": attributes}
+
+    def record(self, count: int, first: int = 0) -> list:
+        return [
+            GameObjectSave.record(self.obj, self.data(i), version=self.version(i))
+            for i in range(first, first + count)
+        ]
+
+
+class TestRecord(SaveTestCase):
+    def test_chain(self):
+        saves = self.record(GameObjectSave.keyframe_interval + 3)
+        interval = GameObjectSave.keyframe_interval
+        chains = [save.chain for save in saves]
+        self.assertEqual(chains, list(range(interval + 1)) + [0, 1])
+        self.obj.refresh_from_db()
+        self.assertEqual(self.obj.latest, saves[-1])
+        for i, save in enumerate(saves):
+            save = GameObjectSave.objects.get(pk=save.pk)
+            self.assertEqual(save.resolve(), self.data(i))
+
+    def test_older_version(self):
+        self.record(3, first=5)
+        with self.assertRaises(ValueError):
+            GameObjectSave.record(self.obj, self.data(2), version=self.version(2))
+        with self.assertRaises(ValueError):
+            GameObjectSave.record(self.obj, self.data(7), version=self.version(7))
+        self.assertEqual(GameObjectSave.objects.filter(obj=self.obj).count(), 3)
+
+    def test_created_directly(self):
+        # Code that creates saves itself gets deltas too.
+        self.record(1)
+        save = GameObjectSave.objects.create(
+            obj=self.obj, version=self.version(1), data=self.data(1)
+        )
+        self.assertEqual(save.chain, 1)
+        self.assertEqual(GameObjectSave.objects.get(pk=save.pk).resolve(), self.data(1))
+        self.obj.refresh_from_db()
+        self.assertEqual(self.obj.latest, save)
+
+
+class TestCompact(SaveTestCase):
+    def full_saves(self, count: int) -> list:
+        """
+        Writes count full saves the way they were stored before deltas.
+        """
+        GameObjectSave.objects.bulk_create(
+            [
+                GameObjectSave(obj=self.obj, version=self.version(i), data=self.data(i))
+                for i in range(count)
+            ]
+        )
+        return list(GameObjectSave.objects.filter(obj=self.obj).order_by("version"))
+
+    def test_compact(self):
+        saves = self.full_saves(10)
+        result = GameObjectSave.compact(self.obj)
+        self.assertEqual(result["rows"], (10, 10))
+        self.assertLess(result["bytes"][1], result["bytes"][0])
+        for i, save in enumerate(saves):
+            save = GameObjectSave.objects.get(pk=save.pk)
+            self.assertEqual(save.chain, i)
+            self.assertEqual(save.resolve(), self.data(i))
+
+    def test_compact_before(self):
+        self.full_saves(10)
+        result = GameObjectSave.compact(self.obj, before=self.version(6))
+        # versions 0-5 fold into version 5, which becomes a keyframe.
+        self.assertEqual(result["rows"], (10, 5))
+        saves = list(GameObjectSave.objects.filter(obj=self.obj).order_by("version"))
+        self.assertEqual(
+            [save.version for save in saves], [self.version(i) for i in range(5, 10)]
+        )
+        self.assertEqual([save.chain for save in saves], [0, 1, 2, 3, 4])
+        for i, save in zip(range(5, 10), saves):
+            self.assertEqual(save.resolve(), self.data(i))
+
+    def test_record_after_compact(self):
+        self.full_saves(3)
+        GameObjectSave.compact(self.obj)
+        save = GameObjectSave.record(self.obj, self.data(3), version=self.version(3))
+        self.assertEqual(save.chain, 3)
+        self.assertEqual(GameObjectSave.objects.get(pk=save.pk).resolve(), self.data(3))